@@ -91,16 +91,67 @@ def draw_polygon(p_list, algorithm):
     return result
 
 
+def fill_polygon(p_list):
+    """扫描线填充多边形（边表 + 活性边表）
+
+    扫描线y与边的交点x = x0 + (y-y0)*dx/dy，以分子num = x0*dy + (y-y0)*dx的整数形式递推，
+    每条边只与y0 <= y < y1的扫描线求交，交点排序后两两配对，填充ceil(左交点)到floor(右交点)的像素
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 多边形的顶点坐标列表
+    :return: (list of tuple of int: [(y, x_start, x_end), ...]) 按扫描线从下到上、从左到右排列的水平像素段，包含两端点
+    """
+    result = []
+    edge_table = {}                     #边表，以边的下端点y为key，value为[y_max, num, dx, dy]
+    for i in range(len(p_list)):
+        (x0, y0), (x1, y1) = p_list[i - 1], p_list[i]
+        if y0 == y1:                    #水平边不与扫描线相交
+            continue
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        edge_table.setdefault(y0, []).append([y1, x0 * (y1 - y0), x1 - x0, y1 - y0])
+    if not edge_table:
+        return result
+    y_start = min(edge_table)
+    y_end = max(e[0] for edges in edge_table.values() for e in edges)
+    active = []                         #活性边表
+    for y in range(y_start, y_end):
+        active = [e for e in active if e[0] > y]
+        active += edge_table.get(y, [])
+        #交点按(x, ceil(x), floor(x))排序
+        xs = sorted((e[1] / e[3], -(-e[1] // e[3]), e[1] // e[3]) for e in active)
+        for left, right in zip(xs[0::2], xs[1::2]):
+            if left[1] <= right[2]:
+                result.append((y, left[1], right[2]))
+        for e in active:
+            e[1] += e[2]
+    return result
+
+
 def draw_ellipse(p_list):
     """绘制椭圆（采用中点圆生成算法）
 
     :param p_list: (list of list of int: [[x0, y0], [x1, y1]]) 椭圆的矩形包围框左上角和右下角顶点坐标
-    :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
+    :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表（不含重复点）
+    """
+    result = []
+    for y, x_start, x_end in ellipse_spans(p_list):
+        for x in range(x_start, x_end + 1):
+            result.append((x, y))
+    return result
+
+
+def ellipse_spans(p_list, fill=False):
+    """中点椭圆生成算法，按扫描线输出水平像素段
+
+    决策变量乘以4后全部为整数，判定结果与浮点形式d = b^2 + a^2*(-b+0.25)相同
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1]]) 椭圆的矩形包围框左上角和右下角顶点坐标
+    :param fill: (bool) 是否填充椭圆内部
+    :return: (list of tuple of int: [(y, x_start, x_end), ...]) 按扫描线从下到上、从左到右排列的水平像素段，包含两端点，互不重叠
     """
 
     #x^2 / a^2 + y^2 / b^2 = 1,F(x,y)= b^2 * x^2 + a^2 * y^2 - a^2 * b^2 = 0
 
-    result = []
     x0, y0 = p_list[0]
     x1, y1 = p_list[1]
     a = round(abs(x1-x0)/2)
@@ -109,37 +160,49 @@ def draw_ellipse(p_list):
     yc = round((y1+y0)/2)
     sqa = a**2
     sqb = b**2
-    
+
     if a==0 or b==0:
-        return draw_line(p_list,'DDA')
-    
+        return [(y, x, x) for x, y in draw_line(p_list,'DDA')]
+
+    #第一象限中每条扫描线上的像素区间[y, x_min, x_max]，y从b递减到0
+    runs = []
     x,y = 0,b
-    d = sqb + sqa*(-b+0.25)     #决策变量，从(0,b)点开始。di = F(xi+1, yi-0.5)
+    d = 4*sqb + sqa*(1-4*b)     #决策变量，从(0,b)点开始。di = 4*F(xi+1, yi-0.5)
     while sqb*(x)< sqa*(y):     #上半部分，dx>dy，即2xb^2>2ya^2
-        result.append((x+xc,y+yc))
-        result.append((x+xc,-y+yc))
-        result.append((-x+xc,y+yc))
-        result.append((-x+xc,-y+yc))
+        if runs and runs[-1][0] == y:
+            runs[-1][2] = x
+        else:
+            runs.append([y, x, x])
         if d < 0:
-            d += sqb*(2*x+3)    #增量 di+1-di
+            d += 4*sqb*(2*x+3)  #增量 di+1-di
         else:
-            d += (sqb*(2*x+3)+sqa*(-2*y+2))
+            d += 4*(sqb*(2*x+3)+sqa*(-2*y+2))
             y-=1
-        x+=1   
-    
-    d = sqb*(x+0.5)**2 + sqa*(y-1)**2 -sqa*sqb
+        x+=1
+
+    d = sqb*(2*x+1)**2 + 4*sqa*(y-1)**2 - 4*sqa*sqb
     while y>=0:                 #下半部分，dx<dy，即2xb^2<2ya^2
-        result.append((x+xc,y+yc))
-        result.append((x+xc,-y+yc))
-        result.append((-x+xc,y+yc))
-        result.append((-x+xc,-y+yc))
+        if runs and runs[-1][0] == y:
+            runs[-1][2] = x
+        else:
+            runs.append([y, x, x])
         if d < 0:
-            d += (sqb*(2*x+2)+sqa*(3-2*y))
+            d += 4*(sqb*(2*x+2)+sqa*(3-2*y))
             x += 1
         else:
-            d += sqa*(3-2*y)
+            d += 4*sqa*(3-2*y)
         y-=1
 
+    #由对称性得到四个象限的像素段，先下半部分(yc-y)，再上半部分(yc+y)，y=0的扫描线只输出一次
+    result = []
+    rows = [(yc - y, x_min, x_max) for y, x_min, x_max in runs]
+    rows += [(yc + y, x_min, x_max) for y, x_min, x_max in reversed(runs) if y > 0]
+    for row, x_min, x_max in rows:
+        if fill or x_min == 0:
+            result.append((row, xc - x_max, xc + x_max))
+        else:
+            result.append((row, xc - x_max, xc - x_min))
+            result.append((row, xc + x_min, xc + x_max))
     return result
 
 
@@ -152,8 +215,8 @@ def draw_curve(p_list, algorithm):
     """
     result = []
     n = len(p_list)     #控制点个数
-    result.append((round(p_list[0][0]), round(p_list[0][1])))
     if algorithm == 'Bezier':
+        result.append((round(p_list[0][0]), round(p_list[0][1])))
         t=0.001
         while t<1:                          #取1000次比例系数t 
             temp = []
@@ -172,10 +235,38 @@ def draw_curve(p_list, algorithm):
             result.append((x,y))
             t+=0.001
     elif algorithm == 'B-spline':
-        pass
+        #三次均匀B样条，n个控制点共n-3段，第i段由控制点i~i+3决定
+        points = []
+        for i in range(n - 3):
+            (x0, y0), (x1, y1), (x2, y2), (x3, y3) = p_list[i:i + 4]
+            #段内速度不超过相邻控制点间距的最大值，按此确定采样数可保证相邻采样点距离不超过1个像素
+            m = max(abs(x1 - x0), abs(y1 - y0), abs(x2 - x1), abs(y2 - y1), abs(x3 - x2), abs(y3 - y2), 1)
+            last = m + 1 if i == n - 4 else m   #最后一段包含t=1
+            for j in range(last):
+                t = j / m
+                b0, b1, b2, b3 = b_spline_basis(t)
+                points.append((round(b0*x0 + b1*x1 + b2*x2 + b3*x3), round(b0*y0 + b1*y1 + b2*y2 + b3*y3)))
+        #去掉相邻的重复点，并用直线连接相邻点以保证曲线连通
+        for p in points:
+            if not result:
+                result.append(p)
+            elif p != result[-1]:
+                result += draw_line([result[-1], p], 'Bresenham')[1:]
     return result
 
 
+def b_spline_basis(t):
+    """三次均匀B样条的基函数
+
+    :param t: (float) 段内参数，取值范围[0, 1]
+    :return: (tuple of float) 四个控制点的权值
+    """
+    u = 1 - t
+    t2 = t * t
+    t3 = t2 * t
+    return u*u*u / 6, (3*t3 - 6*t2 + 4) / 6, (-3*t3 + 3*t2 + 3*t + 1) / 6, t3 / 6
+
+
 def translate(p_list, dx, dy):
     """平移变换
 
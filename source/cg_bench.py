@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 光栅化性能测试，用法: python cg_bench.py
+# 回归测试: python cg_bench.py --suite [--output 结果.json] [--baseline 基准.json] [--threshold 0.25]
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+import cg_algorithms as alg
+import cg_raster as raster
+import cg_clip
+import cg_tiles
+from cg_canvas import Canvas
+from cg_scene import SceneStore
+
+
+def timeit(func, *args, repeat=3):
+    """多次运行取最短耗时(秒)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def random_segments(n, length, seed=0):
+    """生成n条长度约为length的随机线段"""
+    rnd = random.Random(seed)
+    segments = []
+    for _ in range(n):
+        x0, y0 = rnd.randint(0, 1000), rnd.randint(0, 1000)
+        segments.append([[x0, y0], [x0 + rnd.randint(-length, length), y0 + rnd.randint(-length, length)]])
+    return segments
+
+
+def loop_lines(segments, algorithm):
+    """原有的逐条调用draw_line"""
+    result = []
+    for s in segments:
+        result += alg.draw_line(s, algorithm)
+    return result
+
+
+def bench_lines():
+    print('%-10s %8s %8s %12s %12s %8s' % ('algorithm', 'lines', 'length', 'loop(s)', 'batch(s)', 'speedup'))
+    for algorithm in ['DDA', 'Bresenham']:
+        for n, length in [(1000, 100), (1000, 1000), (10000, 500)]:
+            segments = random_segments(n, length)
+            pixels, _ = raster.draw_lines(segments, algorithm)
+            assert pixels.tolist() == [list(p) for p in loop_lines(segments, algorithm)]
+            t_loop = timeit(loop_lines, segments, algorithm)
+            t_batch = timeit(raster.draw_lines, segments, algorithm)
+            print('%-10s %8d %8d %12.4f %12.4f %7.1fx' % (algorithm, n, length, t_loop, t_batch, t_loop / t_batch))
+
+
+def loop_canvas(canvas, pixels, color):
+    """原有的逐像素写入画布"""
+    height = canvas.shape[0]
+    for x, y in pixels:
+        canvas[height - 1 - y, x] = color
+
+
+def bench_canvas():
+    print('%-10s %10s %12s %12s %8s' % ('canvas', 'pixels', 'loop(s)', 'direct(s)', 'speedup'))
+    color = np.array([255, 0, 0], np.uint8)
+    for size, n in [(1000, 1000), (4000, 10000)]:
+        segments = [[[x0 % size, y0 % size], [x1 % size, y1 % size]] for (x0, y0), (x1, y1) in random_segments(n, size // 2)]
+        pixels, _ = raster.draw_lines(segments, 'Bresenham')
+        canvas = np.zeros([size, size, 3], np.uint8)
+        t_loop = timeit(loop_canvas, canvas, pixels.tolist(), color, repeat=1)
+        t_direct = timeit(raster.fill_pixels, canvas, pixels, color)
+        print('%-10s %10d %12.4f %12.4f %7.1fx' % ('%dx%d' % (size, size), len(pixels), t_loop, t_direct, t_loop / t_direct))
+
+
+def bench_bezier():
+    print('%-10s %10s %12s %12s %8s' % ('bezier', 'points', 'loop(s)', 'vector(s)', 'speedup'))
+    rnd = random.Random(0)
+    for n in [4, 16, 64]:
+        p_list = [[rnd.randint(0, 1000), rnd.randint(0, 1000)] for _ in range(n)]
+        t_loop = timeit(alg.draw_curve, p_list, 'Bezier')
+        t_vector = timeit(raster.draw_bezier, p_list)
+        print('%-10s %10d %12.4f %12.4f %7.1fx' % ('', n, t_loop, t_vector, t_loop / t_vector))
+
+
+def ellipse_pixels(p_list, fill):
+    """逐像素路径：展开为像素坐标数组后一次性写入"""
+    spans = alg.ellipse_spans(p_list, fill)
+    #逐像素生成坐标，直接写入数组而不经过元组列表，避免大椭圆的临时列表占用数GB内存
+    coords = (v for y, x0, x1 in spans for x in range(x0, x1 + 1) for v in (x, y))
+    return np.fromiter(coords, np.int32).reshape(-1, 2)
+
+
+def bench_ellipse(strip=256):
+    """生成(像素坐标数组或水平像素段)与写入分别计时；写入的画布只取椭圆最下方strip行，画布外的部分由canvas_index等丢弃"""
+    print('%-10s %8s %12s %12s %12s %12s %12s %8s' % ('ellipse', 'radius', 'pixels', 'pixel(s)', 'span(s)',
+                                                     'write px(s)', 'write sp(s)', 'speedup'))
+    color = np.array([0, 0, 255], np.uint8)
+    #填充半径10000的椭圆有约3亿个像素，像素坐标数组本身就需要数GB，只测试轮廓
+    for fill, radii in [(False, [100, 1000, 10000]), (True, [100, 1000, 2000])]:
+        for r in radii:
+            p_list = [[0, 0], [2 * r, 2 * r]]
+            canvas = np.zeros([min(2 * r + 2, strip), 2 * r + 2, 3], np.uint8)
+            pixels = ellipse_pixels(p_list, fill)
+            spans = np.array(alg.ellipse_spans(p_list, fill))
+            t_pixel = timeit(ellipse_pixels, p_list, fill, repeat=1)
+            t_span = timeit(lambda: np.array(alg.ellipse_spans(p_list, fill)))
+            t_write_pixel = timeit(raster.fill_pixels, canvas, pixels, color)
+            t_write_span = timeit(raster.fill_spans, canvas, spans, color)
+            speedup = (t_pixel + t_write_pixel) / (t_span + t_write_span)
+            print('%-10s %8d %12d %12.4f %12.4f %12.4f %12.4f %7.1fx' % ('filled' if fill else 'outline', r, len(pixels),
+                                                                       t_pixel, t_span, t_write_pixel, t_write_span, speedup))
+
+
+def bench_clip():
+    print('%-18s %8s %12s %12s %8s' % ('clip', 'lines', 'loop(s)', 'batch(s)', 'speedup'))
+    window = (200, 200, 800, 800)
+    segments = random_segments(100000, 500)
+    for algorithm in ['Cohen-Sutherland', 'Liang-Barsky']:
+        t_loop = timeit(lambda: [alg.clip(s, *window, algorithm) for s in segments], repeat=1)
+        t_batch = timeit(cg_clip.clip_many, segments, window, algorithm)
+        print('%-18s %8d %12.4f %12.4f %7.1fx' % (algorithm, len(segments), t_loop, t_batch, t_loop / t_batch))
+
+
+def bench_store():
+    """直线以Python列表保存与以SceneStore的列式数组保存所占的内存"""
+    print('%-10s %8s %12s %12s %8s' % ('store', 'lines', 'list(MB)', 'store(MB)', 'ratio'))
+    color = np.array([0, 0, 0], np.uint8)
+    for n in [100000, 300000]:
+        segments = random_segments(n, 100)
+        #两者都不计id：nbytes不含id字符串与id到行号的字典
+        tracemalloc.start()
+        items = [('line', [list(p) for p in s], 'DDA', [0, 0, 0]) for s in segments]
+        list_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del items
+        store = SceneStore()
+        for i, s in enumerate(segments):
+            store.add('line%d' % i, 'line', s, 'DDA', color)
+        print('%-10s %8d %12.1f %12.1f %7.1fx' % ('', n, list_bytes / 2 ** 20, store.nbytes() / 2 ** 20, list_bytes / store.nbytes()))
+
+
+def random_items(n, size, seed=0):
+    """在size*size的画布上生成n个随机图元(直线、多边形、填充多边形、椭圆)"""
+    rnd = random.Random(seed)
+    items = []
+    for i in range(n):
+        item_type = ['line', 'polygon', 'filled_polygon', 'ellipse'][i % 4]
+        count = 2 if item_type in ('line', 'ellipse') else 5
+        x, y = rnd.randint(0, size), rnd.randint(0, size)
+        p_list = [[x + rnd.randint(0, size // 10), y + rnd.randint(0, size // 10)] for _ in range(count)]
+        color = np.array([rnd.randint(0, 255) for _ in range(3)], np.uint8)
+        items.append((item_type, p_list, '' if item_type == 'ellipse' else 'Bresenham', color))
+    return items
+
+
+def render_serial(size, items):
+    canvas = Canvas(size, size)
+    for i, item in enumerate(items):
+        canvas.set_item(i, *item)
+    return canvas.render()
+
+
+def bench_tiles():
+    print('%-10s %8s %6s %12s %12s %8s' % ('tiles', 'items', 'jobs', 'serial(s)', 'tiled(s)', 'speedup'))
+    size = 8000
+    items = random_items(4000, size)
+    t_serial = timeit(render_serial, size, items, repeat=1)
+    for jobs in sorted({1, 2, 4, 8, 16, os.cpu_count()}):
+        if jobs > os.cpu_count():
+            continue
+        pool = cg_tiles.make_pool(jobs)
+        #每个进程池只计时一次，工作进程中的光栅化缓存为空，与串行绘制公平比较
+        t_tiled = timeit(lambda: cg_tiles.render_tiled(size, size, items, pool), repeat=1)
+        pool.shutdown()
+        print('%-10s %8d %6d %12.4f %12.4f %7.1fx' % ('%dx%d' % (size, size), len(items), jobs, t_serial, t_tiled, t_serial / t_tiled))
+
+
+def paint_loop(painter, item):
+    """原有的逐像素段drawLine、逐像素drawPoint"""
+    p_list = item.points()
+    for y, x0, x1 in raster.rasterize_spans(item.item_type, p_list, item.algorithm).tolist():
+        painter.drawLine(x0, y, x1, y)
+    for x, y in raster.rasterize(item.item_type, p_list, item.algorithm).tolist():
+        painter.drawPoint(x, y)
+
+
+def bench_paint():
+    """图形界面的重绘耗时，每个场景由10个图元组成，需要PyQt5"""
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtGui import QImage, QPainter, QColor
+    from PyQt5.QtCore import Qt
+    import cg_gui
+    app = QApplication.instance() or QApplication(['cg_bench'])
+    print('%-10s %10s %12s %12s %8s' % ('paint', 'pixels', 'loop(s)', 'batch(s)', 'speedup'))
+    image = QImage(1000, 1000, QImage.Format_RGB32)
+    for n in [1000, 10000, 100000]:
+        #每个图元为约n个像素的多边形轮廓：n较小时为三角形，否则为往返n/1000次的锯齿形
+        if n < 3000:
+            p_list = [[0, 0], [n // 3, 0], [0, n // 3]]
+        else:
+            rows = n // 1000
+            p_list = [[0, 0]] + [[999 * ((i + 1) // 2 % 2), i * 999 // (2 * rows)] for i in range(1, 2 * rows)]
+        items = [cg_gui.MyItem(str(i), 'polygon', p_list, 'Bresenham', QColor(i, 0, 0)) for i in range(10)]
+        pixels = len(raster.rasterize('polygon', p_list, 'Bresenham'))
+
+        def repaint(paint):
+            image.fill(Qt.white)
+            painter = QPainter(image)
+            for item in items:
+                painter.setPen(item.color)
+                paint(painter, item)
+            painter.end()
+        t_loop = timeit(repaint, paint_loop, repeat=1)
+        repaint(lambda painter, item: item.paint(painter, None))     #建立各图元的缓存
+        t_batch = timeit(repaint, lambda painter, item: item.paint(painter, None))
+        print('%-10s %10d %12.4f %12.4f %7.1fx' % ('10 items', pixels, t_loop, t_batch, t_loop / t_batch))
+
+
+def measure(func, repeat=5, min_time=0.05):
+    """单次调用的耗时(秒)：每轮连续调用若干次使总耗时不少于min_time，取各轮的最小值"""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    number = max(1, int(min_time / max(elapsed, 1e-9)))
+    best = elapsed
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def random_polygon(n, radius, seed=0):
+    """以(radius, radius)为中心、半径不超过radius的n边形，顶点按角度排列，周长与n基本无关"""
+    rnd = random.Random(seed)
+    p_list = []
+    for i in range(n):
+        a = 2 * math.pi * i / n
+        r = rnd.uniform(radius / 2, radius)
+        p_list.append([radius + round(r * math.cos(a)), radius + round(r * math.sin(a))])
+    return p_list
+
+
+def algorithm_cases():
+    """cg_algorithms中各入口、cg_raster与cg_clip中对应的批量实现，以及画布合成在不同规模下的测试
+
+    :return: (list of tuple: [(名字, 函数), ...]) 每个函数执行一次被测的操作
+    """
+    cases = []
+    for algorithm in ['Naive', 'DDA', 'Bresenham']:
+        for length in [10, 100, 1000]:
+            segments = random_segments(100, length, seed=length)
+            cases.append(('draw_line/%s/100x%d' % (algorithm, length),
+                          lambda segments=segments, algorithm=algorithm: [alg.draw_line(p, algorithm) for p in segments]))
+    for algorithm in ['DDA', 'Bresenham']:
+        for n in [8, 64, 512]:
+            p_list = random_polygon(n, 500, seed=n)
+            cases.append(('draw_polygon/%s/%d' % (algorithm, n), lambda p_list=p_list, algorithm=algorithm: alg.draw_polygon(p_list, algorithm)))
+    for n, radius in [(8, 100), (8, 500), (512, 500)]:
+        p_list = random_polygon(n, radius, seed=n)
+        cases.append(('fill_polygon/%d/r=%d' % (n, radius), lambda p_list=p_list: alg.fill_polygon(p_list)))
+    for radius in [10, 100, 1000]:
+        p_list = [[0, 0], [2 * radius, radius]]
+        cases.append(('draw_ellipse/r=%d' % radius, lambda p_list=p_list: alg.draw_ellipse(p_list)))
+    for radius in [100, 1000]:
+        p_list = [[0, 0], [2 * radius, radius]]
+        cases.append(('ellipse_spans/fill/r=%d' % radius, lambda p_list=p_list: alg.ellipse_spans(p_list, True)))
+    rnd = random.Random(0)
+    for algorithm in ['Bezier', 'B-spline']:
+        for n in [4, 16, 64]:
+            p_list = [[rnd.randint(0, 1000), rnd.randint(0, 1000)] for _ in range(n)]
+            cases.append(('draw_curve/%s/%d' % (algorithm, n), lambda p_list=p_list, algorithm=algorithm: alg.draw_curve(p_list, algorithm)))
+    segments = random_segments(1000, 500)
+    for algorithm in ['Cohen-Sutherland', 'Liang-Barsky']:
+        cases.append(('clip/%s/1000' % algorithm,
+                      lambda algorithm=algorithm: [alg.clip(p, 200, 200, 800, 800, algorithm) for p in segments]))
+    for n in [1000, 100000]:
+        p_list = [[rnd.randint(0, 1000), rnd.randint(0, 1000)] for _ in range(n)]
+        cases.append(('translate/%d' % n, lambda p_list=p_list: alg.translate(p_list, 10, -20)))
+        cases.append(('rotate/%d' % n, lambda p_list=p_list: alg.rotate(p_list, 500, 500, 30)))
+        cases.append(('scale/%d' % n, lambda p_list=p_list: alg.scale(p_list, 500, 500, 1.5)))
+    for algorithm in ['DDA', 'Bresenham']:
+        for n, length in [(100, 1000), (10000, 100)]:
+            batch = random_segments(n, length, seed=length)
+            cases.append(('raster.draw_lines/%s/%dx%d' % (algorithm, n, length),
+                          lambda batch=batch, algorithm=algorithm: raster.draw_lines(batch, algorithm)))
+    for n in [16, 64, 512]:
+        p_list = [[rnd.randint(0, 1000), rnd.randint(0, 1000)] for _ in range(n)]
+        cases.append(('raster.draw_bezier/%d' % n, lambda p_list=p_list: raster.draw_bezier(p_list)))
+        cases.append(('raster.draw_b_spline/%d' % n, lambda p_list=p_list: raster.draw_b_spline(p_list)))
+    for n, radius in [(8, 500), (512, 500)]:
+        p_list = random_polygon(n, radius, seed=n)
+        cases.append(('raster.fill_polygon/%d/r=%d' % (n, radius), lambda p_list=p_list: raster.fill_polygon(p_list)))
+    for n in [1000, 100000]:
+        batch = segments if n == 1000 else random_segments(n, 500)
+        for algorithm in ['Cohen-Sutherland', 'Liang-Barsky']:
+            cases.append(('clip_many/%s/%d' % (algorithm, n),
+                          lambda batch=batch, algorithm=algorithm: cg_clip.clip_many(batch, (200, 200, 800, 800), algorithm)))
+    polygons = [random_polygon(8, 100, seed=i) for i in range(1000)]
+    polygons = [[[x + 100 * (i % 10), y + 100 * (i // 100)] for x, y in p] for i, p in enumerate(polygons)]
+    cases.append(('clip_polygons/1000x8', lambda: cg_clip.clip_polygons(polygons, (200, 200, 800, 800))))
+    cases += render_cases()
+    return cases
+
+
+def render_cases(size=1000, n=2000):
+    """画布合成：整体重绘与只移动一个图元后的增量重绘
+
+    :return: (list of tuple: [(名字, 函数), ...])
+    """
+    items = random_items(n, size, seed=n)
+    full, incremental = Canvas(size, size), Canvas(size, size)
+    for canvas in (full, incremental):
+        for i, item in enumerate(items):
+            canvas.set_item(i, *item)
+        canvas.render()
+    p_list = items[0][1]
+    moved = alg.translate(p_list, 10, 10)
+    state = [False]
+
+    def repaint():
+        full.load(full.items, size, size)
+        full.render()
+
+    def move():
+        #在两个位置间来回移动第一个图元，被它覆盖过的区域需要擦除后重绘
+        state[0] = not state[0]
+        incremental.set_points(0, moved if state[0] else p_list)
+        incremental.render()
+    return [('canvas.render/full/%d' % n, repaint),
+            ('canvas.render/incremental/%d' % n, move)]
+
+
+def random_script(n, size, seed=0, save_every=100):
+    """由random_items生成的命令脚本，每save_every个图元保存一次画布"""
+    lines = ['resetCanvas %d %d' % (size, size)]
+    for i, (item_type, p_list, algorithm, color) in enumerate(random_items(n, size, seed)):
+        lines.append('setColor %d %d %d' % tuple(color.tolist()))
+        points = ' '.join('%d %d' % (x, y) for x, y in p_list)
+        if item_type == 'line':
+            lines.append('drawLine item%d %s %s' % (i, points, algorithm))
+        elif item_type == 'ellipse':
+            lines.append('drawEllipse item%d %s' % (i, points))
+        else:
+            lines.append('drawPolygon item%d %s %s%s' % (i, points, algorithm, ' fill' if item_type == 'filled_polygon' else ''))
+        if (i + 1) % save_every == 0:
+            lines.append('saveCanvas canvas%d' % (i // save_every))
+    lines.append('saveCanvas last')
+    return '\n'.join(lines) + '\n'
+
+
+def cli_cases(workdir):
+    """端到端测试：在子进程中运行cg_cli.py，包括解释器与numpy的启动时间
+
+    :param workdir: (string) 存放脚本与输出图像的目录
+    :return: (list of tuple: [(名字, 函数), ...])
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    scripts = [('input.txt', os.path.join(here, 'input.txt'))]
+    for n in [200, 2000]:
+        path = os.path.join(workdir, 'random%d.txt' % n)
+        with open(path, 'w') as fp:
+            fp.write(random_script(n, 1000, seed=n))
+        scripts.append(('random%d' % n, path))
+    cases = []
+    for name, path in scripts:
+        if not os.path.exists(path):
+            continue
+        output = os.path.join(workdir, name + '.out')
+        command = [sys.executable, os.path.join(here, 'cg_cli.py'), path, output]
+        cases.append(('cli/%s' % name, lambda command=command: subprocess.run(command, check=True, stderr=subprocess.DEVNULL)))
+    return cases
+
+
+def run_suite(repeat=5, pattern=''):
+    """运行回归测试，返回可保存为JSON的结果
+
+    :param repeat: (int) 每个测试的轮数，取最小值
+    :param pattern: (string) 只运行名字包含该字符串的测试
+    :return: (dict) {'machine': 运行环境, 'repeat': 轮数, 'results': {名字: 单次耗时(秒)}}
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, func in algorithm_cases() + cli_cases(workdir):
+            if pattern not in name:
+                continue
+            if name.startswith('cli/'):
+                results[name] = measure(func, min(repeat, 3), min_time=0)
+            else:
+                results[name] = measure(func, repeat)
+            print('%-36s %12.6f' % (name, results[name]), flush=True)
+    machine = {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+               'processor': platform.processor(), 'cpu_count': os.cpu_count()}
+    return {'machine': machine, 'repeat': repeat, 'results': results}
+
+
+def compare(results, baseline, threshold=0.25, min_delta=1e-3):
+    """与基准比较，打印各测试耗时的变化
+
+    :param results: (dict of string -> float) 本次的耗时
+    :param baseline: (dict of string -> float) 基准耗时
+    :param threshold: (float) 耗时超过基准的(1 + threshold)倍视为退化
+    :param min_delta: (float) 耗时增加不超过min_delta秒时不视为退化，避免极短的测试因计时误差误报
+    :return: (list of string) 退化的测试名
+    """
+    regressions = []
+    print('%-36s %12s %12s %8s' % ('benchmark', 'baseline(s)', 'current(s)', 'ratio'))
+    for name, current in results.items():
+        if name not in baseline:
+            print('%-36s %12s %12.6f %8s' % (name, '-', current, 'new'))
+            continue
+        base = baseline[name]
+        ratio = current / base if base > 0 else float('inf')
+        regressed = ratio > 1 + threshold and current - base > min_delta
+        print('%-36s %12.6f %12.6f %7.2fx%s' % (name, base, current, ratio, '  REGRESSION' if regressed else ''))
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--suite', action='store_true', help='运行回归测试，而不是各项优化前后的对比')
+    parser.add_argument('--output', help='将回归测试的结果保存为JSON文件')
+    parser.add_argument('--baseline', help='作为基准的JSON文件(由--output生成)，有测试退化时返回1')
+    parser.add_argument('--threshold', type=float, default=0.25, help='耗时超过基准的(1 + threshold)倍视为退化')
+    parser.add_argument('--repeat', type=int, default=5, help='每个测试的轮数')
+    parser.add_argument('--filter', default='', help='只运行名字包含该字符串的测试')
+    args = parser.parse_args(argv)
+    if not (args.suite or args.output or args.baseline):
+        bench_lines()
+        bench_canvas()
+        bench_bezier()
+        bench_ellipse()
+        bench_clip()
+        bench_store()
+        bench_tiles()
+        bench_paint()
+        return 0
+    report = run_suite(args.repeat, args.filter)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = compare(report['results'], baseline['results'], args.threshold)
+        if regressions:
+            print('%d benchmark(s) regressed by more than %d%%: %s' % (len(regressions), args.threshold * 100, ', '.join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# BMP文件的写入：24位文件头与PIL保存的bmp相同，像素按BMP的自下而上行序、BGR顺序存储；另支持8位调色板bmp
+import struct
+import numpy as np
+import cg_raster as raster
+import cg_cache
+
+#BITMAPFILEHEADER + BITMAPINFOHEADER
+HEADER = struct.Struct('<2sIHHIIiiHHIIiiII')
+PIXELS_PER_METER = 3780     #96dpi，与PIL相同
+
+
+def row_bytes(width, bits=24):
+    """每行像素的字节数，按4字节对齐"""
+    return (width * bits // 8 + 3) // 4 * 4
+
+
+def bmp_header(width, height, bits=24, colors=0):
+    """BMP的文件头，colors为调色板的颜色数，文件头之后紧跟colors * 4字节的调色板"""
+    offset = HEADER.size + colors * 4
+    image_size = row_bytes(width, bits) * height
+    return HEADER.pack(b'BM', offset + image_size, 0, 0, offset, 40, width, height, 1, bits, 0,
+                       image_size, PIXELS_PER_METER, PIXELS_PER_METER, colors, colors)
+
+
+def write_bmp(path, canvas, chunk_rows=256):
+    """将画布逐块写入bmp文件，每次只转换chunk_rows行，不复制整张画布
+
+    :param path: (string) 文件路径
+    :param canvas: (ndarray of uint8: [height, width, 3]) RGB画布，第0行为图像顶部
+    :param chunk_rows: (int) 每次写入的行数
+    """
+    height, width = canvas.shape[:2]
+    stride = row_bytes(width)
+    with open(path, 'wb') as fp:
+        fp.write(bmp_header(width, height))
+        for end in range(height, 0, -chunk_rows):
+            start = max(end - chunk_rows, 0)
+            rows = np.zeros([end - start, stride], np.uint8)
+            rows[:, :width * 3] = canvas[start:end][::-1, :, ::-1].reshape(end - start, -1)
+            fp.write(rows.tobytes())
+
+
+
+def write_bmp_indexed(path, indices, palette, chunk_rows=1024):
+    """将调色板画布逐块写入8位bmp文件
+
+    :param path: (string) 文件路径
+    :param indices: (ndarray of uint8: [height, width]) 每个像素的颜色下标，第0行为图像顶部
+    :param palette: (ndarray of uint8: [N, 3]) RGB调色板，N <= 256
+    :param chunk_rows: (int) 每次写入的行数
+    """
+    height, width = indices.shape
+    stride = row_bytes(width, 8)
+    table = np.zeros([len(palette), 4], np.uint8)
+    table[:, :3] = palette[:, ::-1]
+    with open(path, 'wb') as fp:
+        fp.write(bmp_header(width, height, 8, len(palette)))
+        fp.write(table.tobytes())
+        for end in range(height, 0, -chunk_rows):
+            start = max(end - chunk_rows, 0)
+            rows = np.zeros([end - start, stride], np.uint8)
+            rows[:, :width] = indices[start:end][::-1]
+            fp.write(rows.tobytes())
+
+
+class BmpFramebuffer:
+    """
+    将bmp文件的像素区映射到内存作为画布，图元直接光栅化到文件中，画布可以大于内存
+    """
+    def __init__(self, path, width, height):
+        self.width = width
+        self.height = height
+        stride = row_bytes(width)
+        with open(path, 'wb') as fp:
+            fp.write(bmp_header(width, height))
+            fp.truncate(HEADER.size + stride * height)
+        if width > 0 and height > 0:
+            self.data = np.memmap(path, np.uint8, 'r+', offset=HEADER.size, shape=(height, stride))
+            bgr = self.data[:, :width * 3].reshape(height, width, 3)    #第y行即y坐标，无需翻转
+        else:
+            self.data = None
+            bgr = np.zeros([height, width, 3], np.uint8)
+        #行、通道反序的视图，与cg_raster使用的[height-1-y, x]、RGB画布相同，写入时不产生拷贝
+        self.canvas = bgr[::-1, :, ::-1]
+
+    def clear(self, color=255):
+        self.canvas[...] = color
+
+    def draw_item(self, item_type, p_list, algorithm, color):
+        """光栅化一个图元并写入文件，先写水平像素段再写像素点，与cg_canvas.Canvas相同"""
+        raster.fill_spans(self.canvas, cg_cache.spans(item_type, p_list, algorithm), color)
+        raster.fill_pixels(self.canvas, cg_cache.rasterize(item_type, p_list, algorithm), color)
+
+    def close(self):
+        """写回文件；映射在不再被引用后释放"""
+        if self.data is not None:
+            self.data.flush()
+        self.data = self.canvas = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 光栅化结果缓存，命令行程序与图形界面共用
+from collections import OrderedDict
+import cg_raster as raster
+
+
+class RasterCache:
+    """
+    以(图元类型, 图元参数, 画法)为key的LRU缓存，按缓存中的像素总数淘汰(水平像素段按每段一个计)
+    """
+    def __init__(self, max_pixels=1 << 23):
+        self.max_pixels = max_pixels
+        self._entries = OrderedDict()
+        self.pixels = 0         #当前缓存的像素总数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(item_type, p_list, algorithm):
+        return item_type, tuple((int(x), int(y)) for x, y in p_list), algorithm
+
+    def rasterize(self, item_type, p_list, algorithm):
+        """返回图元的像素点坐标，与cg_raster.rasterize相同(返回的数组只读)
+
+        :param item_type: (string) 图元类型，'line'、'polygon'、'filled_polygon'、'ellipse'、'curve'
+        :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 图元参数
+        :param algorithm: (string) 绘制算法
+        :return: (ndarray of int32: [M, 2]) 绘制结果的像素点坐标
+        """
+        return self._lookup(('pixels',) + self.key(item_type, p_list, algorithm), raster.rasterize)
+
+    def spans(self, item_type, p_list, algorithm):
+        """返回填充图元的水平像素段，与cg_raster.rasterize_spans相同(返回的数组只读)"""
+        return self._lookup(('spans',) + self.key(item_type, p_list, algorithm), raster.rasterize_spans)
+
+    def _lookup(self, key, compute):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        _, item_type, points, algorithm = key
+        return self._store(key, compute(item_type, points, algorithm))
+
+    def peek(self, item_type, p_list, algorithm):
+        """已缓存时返回(水平像素段, 像素点坐标)，否则返回None；不计入命中统计，也不调整淘汰次序"""
+        key = self.key(item_type, p_list, algorithm)
+        spans = self._entries.get(('spans',) + key)
+        pixels = self._entries.get(('pixels',) + key)
+        if spans is None or pixels is None:
+            return None
+        return spans, pixels
+
+    def put(self, item_type, p_list, algorithm, spans, pixels):
+        """存入在别处(如后台线程中)计算好的水平像素段与像素点坐标"""
+        key = self.key(item_type, p_list, algorithm)
+        self._store(('spans',) + key, spans)
+        self._store(('pixels',) + key, pixels)
+
+    def _store(self, key, value):
+        value.setflags(write=False)
+        if key in self._entries:
+            self.pixels -= len(self._entries.pop(key))
+        if len(value) <= self.max_pixels:
+            self._entries[key] = value
+            self.pixels += len(value)
+            while self.pixels > self.max_pixels:
+                _, old = self._entries.popitem(last=False)
+                self.pixels -= len(old)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.pixels = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'pixels': self.pixels,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+#默认的全局缓存
+cache = RasterCache()
+
+
+def rasterize(item_type, p_list, algorithm):
+    """使用全局缓存光栅化图元"""
+    return cache.rasterize(item_type, p_list, algorithm)
+
+
+def spans(item_type, p_list, algorithm):
+    """使用全局缓存计算填充图元的水平像素段"""
+    return cache.spans(item_type, p_list, algorithm)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 命令行程序使用的持久画布：saveCanvas时只重绘发生变化的部分，直线按列式存储整批光栅化
+import numpy as np
+import cg_raster as raster
+import cg_cache
+from cg_scene import SceneStore, TYPES
+
+LINE = TYPES.index('line')
+SPAN_TYPES = [TYPES.index(t) for t in ('filled_polygon', 'ellipse', 'filled_ellipse')]     #含水平像素段的图元
+
+
+class Canvas:
+    """
+    画布状态，items为列式存储的场景(SceneStore)，其中图元的顺序即绘制顺序，按id读取得到(类型, 点, 画法, 颜色)
+
+    画布不保存各图元的像素：图元所占的区域由控制点的包围盒得到，重绘时直线整批光栅化，其余图元经cg_cache取得
+    """
+    background = 255        #背景(白色)
+    chunk_pixels = 1 << 20  #一批光栅化的直线的像素数上限，限制临时数组的大小
+
+    def __init__(self, width=0, height=0):
+        self.width = 0
+        self.height = 0
+        self.buffer = None
+        self.reset(width, height)
+
+    def reset(self, width, height):
+        """清空画布。尺寸不变时复用原有数组，推迟到下一次render时整体填白；尺寸改变时数组在render时才分配"""
+        if (width, height) != (self.width, self.height):
+            self.width = width
+            self.height = height
+            self.buffer = None
+        self.items = SceneStore()
+        self._dirty = set()     #上次render之后新画或修改的图元id
+        self._stale = []        #已被修改或删除的图元的旧区域(r0, r1, c0, c1)
+        self._full = True       #需要整体重绘
+
+    def load(self, items, width, height):
+        """以载入的场景(如cg_scene.read_scene的结果)替换画布内容，下一次render时整体重绘"""
+        self.reset(width, height)
+        self.items = items
+
+    def set_item(self, item_id, item_type, p_list, algorithm, color):
+        """绘制图元；id已存在时原地替换，保持原有的绘制顺序"""
+        self._forget(item_id)
+        self.items.add(item_id, item_type, p_list, algorithm, color)
+        self._dirty.add(item_id)
+
+    def set_points(self, item_id, p_list):
+        """更新图元参数(平移、旋转、缩放、裁剪)"""
+        self._forget(item_id)
+        self.items.set_points(item_id, p_list)
+        self._dirty.add(item_id)
+
+    def set_color(self, item_id, color):
+        self._forget(item_id)
+        self.items.set_color(item_id, color)
+        self._dirty.add(item_id)
+
+    def remove_item(self, item_id):
+        self._forget(item_id)
+        self.items.remove(item_id)
+        self._dirty.discard(item_id)
+
+    def _forget(self, item_id):
+        """图元将被修改或删除：已画到画布上的，记录其旧区域以便擦除"""
+        if not self._full and item_id in self.items and item_id not in self._dirty:
+            row = self.items.index[item_id]
+            if self.items.count[row]:
+                self._stale.append(tuple(self._boxes(np.array([row]))[0]))
+
+    def _allocate(self):
+        return np.empty([self.height, self.width, 3], np.uint8)
+
+    def _pixel_value(self, color):
+        """颜色在画布中的取值，调色板画布为颜色下标"""
+        return color
+
+    def _boxes(self, rows):
+        """图元像素在画布上可能占据的区域，由控制点的包围盒外扩1个像素得到，见cg_tiles.item_rows_cols
+
+        :param rows: (ndarray of int) items中的行号，各行至少有一个顶点
+        :return: (ndarray of int64: [K, 4]) 每行的(r0, r1, c0, c1)，不含r1、c1，未裁剪到画布内
+        """
+        x_min, y_min, x_max, y_max = self.items.bounds(rows).astype(np.int64).T
+        return np.stack([self.height - 2 - y_max, self.height + 1 - y_min, x_min - 1, x_max + 2], axis=1)
+
+    def _rasterize(self, rows):
+        """光栅化一批图元的像素点(不含水平像素段)，直线按画法整批计算
+
+        :param rows: (ndarray of int) 按绘制顺序排列的行号
+        :return: (ndarray of int32: [M, 2], ndarray of int64: [K+1]) 按行的顺序拼接的像素点坐标及偏移数组
+        """
+        store = self.items
+        types = store.type[rows]
+        algorithms = store.algorithm[rows]
+        counts = np.zeros(len(rows), np.int64)
+        pieces = {}
+        for i in np.flatnonzero(types != LINE).tolist():
+            item_type, p_list, algorithm, _ = store.row_item(rows[i])
+            pieces[i] = cg_cache.rasterize(item_type, p_list, algorithm)
+            counts[i] = len(pieces[i])
+        groups = []
+        for code in np.unique(algorithms[types == LINE]).tolist():
+            index = np.flatnonzero((types == LINE) & (algorithms == code))
+            pixels, offsets = raster.draw_lines(store.segments(rows[index]), store.algorithms[code])
+            counts[index] = np.diff(offsets)
+            groups.append((index, pixels, offsets))
+        offsets = np.zeros(len(rows) + 1, np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        result = np.empty([offsets[-1], 2], np.int32)
+        for i, pixels in pieces.items():
+            result[offsets[i]:offsets[i + 1]] = pixels
+        for index, pixels, group_offsets in groups:
+            #每组直线的像素整体移到各自在绘制顺序中的位置
+            target = np.repeat(offsets[index] - group_offsets[:-1], np.diff(group_offsets)) + np.arange(len(pixels))
+            result[target] = pixels
+        return result, offsets
+
+    def _chunks(self, rows):
+        """将行号分批，每批直线的像素数(由端点估计)不超过chunk_pixels"""
+        store = self.items
+        estimate = np.ones(len(rows), np.int64)
+        line = store.type[rows] == LINE
+        if line.any():
+            segments = store.segments(rows[line]).astype(np.int64)
+            estimate[line] = np.abs(segments[:, 1] - segments[:, 0]).max(axis=1) + 1
+        total = np.cumsum(estimate)
+        start = 0
+        while start < len(rows):
+            base = total[start - 1] if start else 0
+            end = max(int(np.searchsorted(total, base + self.chunk_pixels, side='right')), start + 1)
+            yield rows[start:end]
+            start = end
+
+    def _paint(self, rows, region=None):
+        """按绘制顺序将图元写入画布，region=(r0, r1, c0, c1)时只写入该区域内的部分
+
+        相邻且颜色相同、不含水平像素段的图元的像素一次写入；水平像素段须在本图元的像素点之前、前面图元的像素之后写入
+        """
+        store = self.items
+        rows = rows[store.count[rows] > 0]
+        r0, r1, c0, c1 = region if region is not None else (0, self.height, 0, self.width)
+        for chunk in self._chunks(rows):
+            pixels, offsets = self._rasterize(chunk)
+            rows_index = self.height - 1 - pixels[:, 1].astype(np.intp)
+            cols_index = pixels[:, 0].astype(np.intp)
+            inside = (rows_index >= r0) & (rows_index < r1) & (cols_index >= c0) & (cols_index < c1)
+            kept = np.zeros(len(inside) + 1, np.int64)
+            np.cumsum(inside, out=kept[1:])
+            offsets = kept[offsets]                 #丢弃区域外的像素后各行的偏移
+            rows_index, cols_index = rows_index[inside], cols_index[inside]
+            colors = store.color[chunk]
+            spans = np.isin(store.type[chunk], SPAN_TYPES)
+            starts = np.flatnonzero(np.concatenate([[True], np.any(colors[1:] != colors[:-1], axis=1)]) | spans).tolist()
+            for start, end in zip(starts, starts[1:] + [len(chunk)]):
+                color = self._pixel_value(colors[start])
+                if spans[start]:
+                    item_type, p_list, algorithm, _ = store.row_item(chunk[start])
+                    span_rows, s0, s1 = raster.canvas_spans(cg_cache.spans(item_type, p_list, algorithm), self.height, self.width)
+                    s0, s1 = np.maximum(s0, c0), np.minimum(s1, c1)
+                    keep = (span_rows >= r0) & (span_rows < r1) & (s0 < s1)
+                    raster.fill_rows(self.buffer, span_rows[keep], s0[keep], s1[keep], color)
+                a, b = offsets[start], offsets[end]
+                if a < b:
+                    self.buffer[rows_index[a:b], cols_index[a:b]] = color
+
+    def render(self):
+        """合成画布并返回[height, width, 3]的uint8数组(返回的是内部缓冲区，调用方不应修改)"""
+        store = self.items
+        if self.buffer is None:
+            self.buffer = self._allocate()
+            self._full = True
+        if self._full:
+            self.buffer.fill(self.background)
+            self._paint(store.live_rows())
+        elif self._stale:
+            #有图元被修改或删除：擦除旧区域与新区域的并集，再按绘制顺序重绘与之相交的图元
+            dirty = np.array(sorted(store.index[i] for i in self._dirty), np.int64)
+            dirty = dirty[store.count[dirty] > 0]
+            boxes = np.concatenate([np.array(self._stale, np.int64).reshape(-1, 4), self._boxes(dirty)])
+            r0, r1 = max(int(boxes[:, 0].min()), 0), min(int(boxes[:, 1].max()), self.height)
+            c0, c1 = max(int(boxes[:, 2].min()), 0), min(int(boxes[:, 3].max()), self.width)
+            if r0 < r1 and c0 < c1:
+                self.buffer[r0:r1, c0:c1] = self.background
+                rows = store.live_rows()
+                rows = rows[store.count[rows] > 0]
+                b = self._boxes(rows)
+                rows = rows[(b[:, 0] < r1) & (b[:, 1] > r0) & (b[:, 2] < c1) & (b[:, 3] > c0)]
+                self._paint(rows, (r0, r1, c0, c1))
+        elif self._dirty:
+            #只有新绘制的图元，它们位于最上层，直接画上去
+            self._paint(np.array(sorted(store.index[i] for i in self._dirty), np.int64))
+        self._dirty.clear()
+        self._stale = []
+        self._full = False
+        return self.buffer
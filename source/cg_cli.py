@@ -3,84 +3,267 @@
 
 import sys
 import os
+import time
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import cg_algorithms as alg
+import cg_cache
+import cg_clip
+import cg_tiles
+import cg_bmp
+import cg_scene
+from cg_canvas import Canvas
+from cg_palette import IndexedCanvas, PaletteOverflow
 import numpy as np
-from PIL import Image
+
+
+class Executor:
+    """
+    命令执行器，保存画布、画笔颜色等状态，每个方法对应一条命令
+    """
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.canvas = Canvas()      #待画的图形信息，以id为key,value包括所给类型、点、画法、颜色，并缓存光栅化结果
+        self.pen_color = np.zeros(3, np.uint8)
+
+    def reset_canvas(self, width, height):
+        self.canvas.reset(width, height)
+
+    def save_canvas(self, save_name):
+        #画出目前画布中的图形并存储，只重绘上次保存后发生变化的图元
+        cg_bmp.write_bmp(os.path.join(self.output_dir, save_name + '.bmp'), self.canvas.render())
+
+    def save_scene(self, save_name):
+        #将画布中的图元保存为二进制场景文件，之后可用loadScene直接载入，无需重放命令
+        cg_scene.write_scene(os.path.join(self.output_dir, save_name + '.scene'), self.canvas.items,
+                             self.canvas.width, self.canvas.height)
+
+    def load_scene(self, load_name):
+        #以场景文件的内容(包括画布尺寸)替换画布，文件映射到内存，不逐个解析图元
+        items, width, height = cg_scene.read_scene(os.path.join(self.output_dir, load_name + '.scene'))
+        self.canvas.load(items, width, height)
+
+    def set_color(self, r, g, b):
+        self.pen_color[:] = r, g, b
+
+    def draw_line(self, item_id, p_list, algorithm):
+        self.canvas.set_item(item_id, 'line', p_list, algorithm, self.pen_color)
+
+    def draw_polygon(self, item_id, p_list, algorithm, fill):
+        self.canvas.set_item(item_id, 'filled_polygon' if fill else 'polygon', p_list, algorithm, self.pen_color)
+
+    def draw_ellipse(self, item_id, p_list, fill):
+        self.canvas.set_item(item_id, 'filled_ellipse' if fill else 'ellipse', p_list, '', self.pen_color)
+
+    def draw_curve(self, item_id, p_list, algorithm):
+        self.canvas.set_item(item_id, 'curve', p_list, algorithm, self.pen_color)
+
+    def translate(self, item_id, dx, dy):
+        self.canvas.set_points(item_id, alg.translate(self.canvas.items.points(item_id).tolist(), dx, dy))
+
+    def rotate(self, item_id, x, y, r):
+        self.canvas.set_points(item_id, alg.rotate(self.canvas.items.points(item_id).tolist(), x, y, r))
+
+    def scale(self, item_id, x, y, s):
+        self.canvas.set_points(item_id, alg.scale(self.canvas.items.points(item_id).tolist(), x, y, s))
+
+    def clip(self, item_id, x_min, y_min, x_max, y_max, algorithm):
+        item_type = self.canvas.items[item_id][0]
+        p_list = cg_clip.clip_item(item_type, self.canvas.items.points(item_id).tolist(), (x_min, y_min, x_max, y_max), algorithm)
+        if p_list == []:            #图元完全在窗口外
+            self.canvas.remove_item(item_id)
+        else:
+            self.canvas.set_points(item_id, p_list)
+
+    def close(self):
+        pass
+
+
+def render_snapshot(width, height, items, path):
+    """光栅化一次saveCanvas时的画布快照并写入文件，在工作进程中执行
+
+    :param items: (SceneStore) 画布中图元的拷贝
+    """
+    canvas = Canvas()
+    canvas.load(items, width, height)
+    cg_bmp.write_bmp(path, canvas.render())
+
+
+def init_worker(max_pixels):
+    """限制工作进程中光栅化缓存的大小"""
+    cg_cache.cache = cg_cache.RasterCache(max_pixels)
+
+
+class ParallelExecutor(Executor):
+    """
+    saveCanvas时只记录画布快照，由进程池光栅化并写入文件，输出与串行执行逐字节相同
+    """
+    def __init__(self, output_dir, jobs, max_pixels=1 << 20):
+        super().__init__(output_dir)
+        self.pool = ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(max_pixels,))
+        self.pending = OrderedDict()    #文件路径 -> 未完成的任务，按提交顺序排列
+        self.max_pending = 2 * jobs     #限制排队中的快照数，避免快照占用过多内存
+
+    def save_canvas(self, save_name):
+        path = os.path.join(self.output_dir, save_name + '.bmp')
+        if path in self.pending:        #同名文件以后保存的为准，须等待之前的写入完成
+            self.pending.pop(path).result()
+        while len(self.pending) >= self.max_pending:
+            self.pending.popitem(last=False)[1].result()
+        #复制一份压缩后的场景，之后的命令不会影响已提交的快照；各列数组整体序列化
+        items = self.canvas.items.copy()
+        self.pending[path] = self.pool.submit(render_snapshot, self.canvas.width, self.canvas.height, items, path)
+
+    def close(self):
+        for future in self.pending.values():
+            future.result()
+        self.pending.clear()
+        self.pool.shutdown()
+
+
+class TiledExecutor(Executor):
+    """
+    saveCanvas时将画布分块，由进程池并行绘制到共享内存中再保存，用于单张很大的画布
+    """
+    def __init__(self, output_dir, jobs, tile_size):
+        super().__init__(output_dir)
+        self.pool = cg_tiles.make_pool(jobs)
+        self.tile_size = tile_size
+
+    def save_canvas(self, save_name):
+        items = self.canvas.items.values()
+        cg_tiles.render_tiled(self.canvas.width, self.canvas.height, items, self.pool, self.tile_size,
+                              os.path.join(self.output_dir, save_name + '.bmp'))
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class MappedExecutor(Executor):
+    """
+    saveCanvas时将bmp文件的像素区映射到内存，图元直接光栅化到文件中，内存中不保存整张画布
+    """
+    def save_canvas(self, save_name):
+        path = os.path.join(self.output_dir, save_name + '.bmp')
+        with cg_bmp.BmpFramebuffer(path, self.canvas.width, self.canvas.height) as framebuffer:
+            framebuffer.clear()
+            for item_type, p_list, algorithm, color in self.canvas.items.values():
+                framebuffer.draw_item(item_type, p_list, algorithm, color)
+
+
+class IndexedExecutor(Executor):
+    """
+    使用调色板画布，saveCanvas时输出8位调色板图像
+    """
+    def __init__(self, output_dir, fmt='bmp'):
+        super().__init__(output_dir)
+        self.canvas = IndexedCanvas()
+        self.fmt = fmt
+
+    def save_canvas(self, save_name):
+        self.canvas.save(os.path.join(self.output_dir, save_name + '.' + self.fmt), self.fmt)
+
+
+def parse_points(args):
+    """将[x0, y0, x1, y1, ...]解析为[[x0, y0], [x1, y1], ...]"""
+    return [[int(args[i]), int(args[i + 1])] for i in range(0, len(args) - 1, 2)]
+
+
+def parse_fill(args):
+    """去掉末尾可选的fill参数，返回(其余参数, 是否填充)"""
+    if args[-1] == 'fill':
+        return args[:-1], True
+    return args, False
+
+
+def parse_draw_polygon(args):
+    args, fill = parse_fill(args)
+    return args[0], parse_points(args[1:-1]), args[-1], fill
+
+
+def parse_draw_ellipse(args):
+    args, fill = parse_fill(args)
+    return args[0], parse_points(args[1:5]), fill
+
+
+#命令表：命令名 -> (参数解析函数, 执行器的方法名)，参数解析函数的输入为命令名之后的各参数；
+#按方法名在执行器实例上调用，子类重写的方法(如并行保存画布)才会生效
+COMMANDS = {
+    'resetCanvas': (lambda args: (int(args[0]), int(args[1])), 'reset_canvas'),
+    'saveCanvas': (lambda args: (args[0],), 'save_canvas'),
+    'saveScene': (lambda args: (args[0],), 'save_scene'),
+    'loadScene': (lambda args: (args[0],), 'load_scene'),
+    'setColor': (lambda args: (int(args[0]), int(args[1]), int(args[2])), 'set_color'),
+    'drawLine': (lambda args: (args[0], parse_points(args[1:5]), args[5]), 'draw_line'),
+    'drawPolygon': (parse_draw_polygon, 'draw_polygon'),
+    'drawEllipse': (parse_draw_ellipse, 'draw_ellipse'),
+    'drawCurve': (lambda args: (args[0], parse_points(args[1:-1]), args[-1]), 'draw_curve'),
+    'translate': (lambda args: (args[0], int(args[1]), int(args[2])), 'translate'),
+    'rotate': (lambda args: (args[0], int(args[1]), int(args[2]), float(args[3])), 'rotate'),
+    'scale': (lambda args: (args[0], int(args[1]), int(args[2]), float(args[3])), 'scale'),
+    'clip': (lambda args: (args[0], int(args[1]), int(args[2]), int(args[3]), int(args[4]), args[5]), 'clip'),
+}
+
+
+def parse(fp):
+    """逐行解析命令脚本，空行与未知命令被跳过
+
+    :param fp: (iterable of str) 命令脚本的各行，逐行读取，不保留已解析的行
+    :return: (generator of (string, tuple)) 执行器的方法名及其参数
+    """
+    for line in fp:
+        line = line.split()
+        if not line or line[0] not in COMMANDS:
+            continue
+        parser, handler = COMMANDS[line[0]]
+        yield handler, parser(line[1:])
+
+
+def execute(commands, executor):
+    """依次执行解析好的命令，返回执行的命令数"""
+    count = 0
+    for handler, args in commands:
+        getattr(executor, handler)(*args)
+        count += 1
+    return count
 
 
 if __name__ == '__main__':
-    input_file = sys.argv[1]
-    output_dir = sys.argv[2]
-    os.makedirs(output_dir, exist_ok=True)
-
-    item_dict = {}          #待画的图形信息，以id为key,value包括所给类型、点、画法
-    pen_color = np.zeros(3, np.uint8)
-    width = 0
-    height = 0
-
-    with open(input_file, 'r') as fp:
-        line = fp.readline()
-        while line:
-            line = line.strip().split(' ')
-            para_num = len(line)            #参数长度
-            point = []                      #点的坐标list
-            if line[0] == 'resetCanvas':
-                width = int(line[1])
-                height = int(line[2])
-                item_dict = {}
-            elif line[0] == 'saveCanvas':
-                #画出目前在item_dict中的图形并存储
-                save_name = line[1]
-                canvas = np.zeros([height, width, 3], np.uint8)
-                canvas.fill(255)
-                for item_type, p_list, algorithm, color in item_dict.values():
-                    if item_type == 'line':
-                        pixels = alg.draw_line(p_list, algorithm)
-                    elif item_type == 'polygon':
-                        pixels = alg.draw_polygon(p_list, algorithm)
-                    elif item_type == 'ellipse':
-                        pixels = alg.draw_ellipse(p_list)
-                    elif item_type == 'curve':
-                        pixels = alg.draw_curve(p_list, algorithm)
-                    for x, y in pixels:
-                        canvas[height - 1 - y, x] = color
-                Image.fromarray(canvas).save(os.path.join(output_dir, save_name + '.bmp'), 'bmp')
-            elif line[0] == 'setColor':
-                pen_color[0] = int(line[1])
-                pen_color[1] = int(line[2])
-                pen_color[2] = int(line[3])
-            elif line[0] == 'drawLine':
-                item_id = line[1]
-                x0 = int(line[2])
-                y0 = int(line[3])
-                x1 = int(line[4])
-                y1 = int(line[5])
-                algorithm = line[6]
-                item_dict[item_id] = ['line', [[x0, y0], [x1, y1]], algorithm, np.array(pen_color)]
-            elif line[0] == 'drawPolygon':
-                item_id = line[1]
-                i = 2
-                while i+1 < (para_num):
-                    point.append([int(line[i]),int(line[i+1])])
-                    i += 2
-                algorithm = line[i]
-                item_dict[item_id] = ['polygon', point, algorithm, np.array(pen_color)]
-            elif line[0] == 'drawEllipse':
-                item_id = line[1]
-                i = 2
-                while i+1 < (para_num):
-                    point.append([int(line[i]),int(line[i+1])])
-                    i += 2
-                item_dict[item_id] = ['ellipse', point, '', np.array(pen_color)]
-            elif line[0] == 'drawCurve':
-                item_id = line[1]
-                i = 2
-                while i+1 < (para_num):
-                    point.append([int(line[i]),int(line[i+1])])
-                    i += 2
-                algorithm = line[i]
-                item_dict[item_id] = ['curve', point, algorithm, np.array(pen_color)]
-                
-            ...
-
-            line = fp.readline()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file')
+    parser.add_argument('output_dir')
+    parser.add_argument('--jobs', type=int, default=1, help='并行保存画布的进程数')
+    #画布的种类只能选一种；--jobs只用于并行保存画布或分块绘制
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--palette', nargs='?', const='bmp', choices=['bmp', 'png'],
+                      help='使用调色板画布，输出8位bmp或png')
+    mode.add_argument('--mmap', action='store_true', help='直接光栅化到内存映射的bmp文件中，用于大于内存的画布')
+    mode.add_argument('--tile-size', type=int, default=0, help='大于0时每张画布分块并行绘制，为块的边长')
+    args = parser.parse_args()
+    if args.jobs > 1 and (args.palette or args.mmap):
+        parser.error('argument --jobs: not supported with --%s' % ('palette' if args.palette else 'mmap'))
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    if args.palette:
+        executor = IndexedExecutor(args.output_dir, args.palette)
+    elif args.mmap:
+        executor = MappedExecutor(args.output_dir)
+    elif args.tile_size > 0:
+        executor = TiledExecutor(args.output_dir, args.jobs, args.tile_size)
+    elif args.jobs > 1:
+        executor = ParallelExecutor(args.output_dir, args.jobs)
+    else:
+        executor = Executor(args.output_dir)
+    try:
+        with open(args.input_file, 'r') as fp:
+            count = execute(parse(fp), executor)
+    except PaletteOverflow:
+        #调色板画布最多256种颜色(含白色背景)，颜色更多的脚本只能用RGB画布
+        parser.exit(1, '%s: error: the script uses more than 255 colors besides the white background, which do not fit an 8-bit palette; '
+                       'run it without --palette\n' % parser.prog)
+    finally:
+        executor.close()
+    elapsed = time.perf_counter() - start
+    print('%d commands in %.3fs (%.0f commands/s)' % (count, elapsed, count / max(elapsed, 1e-9)), file=sys.stderr)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 基于numpy的批量裁剪，线段裁剪结果与cg_algorithms.clip逐条裁剪一致
+import numpy as np
+import cg_algorithms as alg
+
+
+def _outcode(x, y, x_min, y_min, x_max, y_max):
+    """Cohen-Sutherland区域码，与cg_algorithms.clip相同：1左 2右 4下 8上"""
+    return ((x < x_min) * 1 | (x > x_max) * 2 | (y < y_min) * 4 | (y > y_max) * 8).astype(np.int8)
+
+
+def clip_many(segments, window, algorithm):
+    """批量线段裁剪
+
+    :param segments: (array_like of int: [N, 2, 2]) N条线段的起点和终点坐标
+    :param window: (tuple of int: (x_min, y_min, x_max, y_max)) 裁剪窗口
+    :param algorithm: (string) 使用的裁剪算法，包括'Cohen-Sutherland'和'Liang-Barsky'
+    :return: (ndarray of int64: [K, 2, 2], ndarray of bool: [N]) 保留下来的线段(已裁剪)，以及每条线段是否保留
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+    if algorithm == 'Cohen-Sutherland':
+        result, keep = _cohen_sutherland(segments, *window)
+    elif algorithm == 'Liang-Barsky':
+        result, keep = _liang_barsky(segments, *window)
+    else:
+        raise ValueError('unknown clip algorithm: %s' % algorithm)
+    return np.rint(result[keep]).astype(np.int64), keep
+
+
+def _cohen_sutherland(segments, x_min, y_min, x_max, y_max):
+    """对所有未决的线段同时执行一轮编码裁剪，直到全部接受或舍弃(每条线段最多4轮)"""
+    x0, y0 = segments[:, 0, 0].copy(), segments[:, 0, 1].copy()
+    x1, y1 = segments[:, 1, 0].copy(), segments[:, 1, 1].copy()
+    keep = np.zeros(len(segments), bool)
+    todo = np.arange(len(segments))
+    while len(todo):
+        code0 = _outcode(x0[todo], y0[todo], x_min, y_min, x_max, y_max)
+        code1 = _outcode(x1[todo], y1[todo], x_min, y_min, x_max, y_max)
+        accept = (code0 == 0) & (code1 == 0)
+        keep[todo[accept]] = True
+        pending = ~accept & ((code0 & code1) == 0)
+        todo, code0, code1 = todo[pending], code0[pending], code1[pending]
+        #保证起点在窗口外
+        swap = code0 == 0
+        s = todo[swap]
+        x0[s], y0[s], x1[s], y1[s] = x1[s], y1[s], x0[s], y0[s]
+        code0 = np.where(swap, code1, code0)
+        ax, ay, bx, by = x0[todo], y0[todo], x1[todo], y1[todo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            left = (code0 & 1) != 0
+            right = ~left & ((code0 & 2) != 0)
+            bottom = ~left & ~right & ((code0 & 4) != 0)
+            top = ~left & ~right & ~bottom
+            edge_x = np.where(left, x_min, x_max)
+            u = (edge_x - ax) / (bx - ax)
+            vertical = left | right
+            new_x = np.where(vertical, edge_x, ax)
+            new_y = np.where(vertical, ay + u * (by - ay), ay)
+            edge_y = np.where(bottom, y_min, y_max)
+            u = (edge_y - ay) / (by - ay)
+            new_x = np.where(bottom | top, ax + u * (bx - ax), new_x)
+            new_y = np.where(bottom | top, edge_y, new_y)
+        x0[todo], y0[todo] = new_x, new_y
+    result = np.stack([np.stack([x0, y0], axis=1), np.stack([x1, y1], axis=1)], axis=1)
+    return result, keep
+
+
+def _liang_barsky(segments, x_min, y_min, x_max, y_max):
+    """梁友栋-Barsky裁剪，对所有线段同时计算参数u1、u2"""
+    x0, y0 = segments[:, 0, 0], segments[:, 0, 1]
+    x1, y1 = segments[:, 1, 0], segments[:, 1, 1]
+    dx, dy = x1 - x0, y1 - y0
+    p = np.stack([-dx, dx, -dy, dy], axis=1)
+    q = np.stack([x0 - x_min, x_max - x0, y0 - y_min, y_max - y0], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = q / p
+    #与边界平行(p=0)时，q<0说明完全在窗口外，否则该边界不起作用
+    outside = np.any((p == 0) & (q < 0), axis=1)
+    u1 = np.max(np.where(p < 0, r, 0), axis=1, initial=0)
+    u2 = np.min(np.where(p > 0, r, 1), axis=1, initial=1)
+    keep = ~outside & (u1 <= u2)
+    result = np.stack([np.stack([x0 + u1 * dx, y0 + u1 * dy], axis=1),
+                       np.stack([x0 + u2 * dx, y0 + u2 * dy], axis=1)], axis=1)
+    return result, keep
+
+
+def clip_polygon(p_list, window):
+    """Sutherland-Hodgman多边形裁剪
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 多边形的顶点坐标列表
+    :param window: (tuple of int: (x_min, y_min, x_max, y_max)) 裁剪窗口
+    :return: (ndarray of int64: [M, 2]) 裁剪后多边形的顶点坐标(已去掉相邻的重复顶点)，完全在窗口外时为空
+    """
+    polygons, keep = clip_polygons([p_list], window)
+    return polygons[0] if keep[0] else np.empty((0, 2), np.int64)
+
+
+def clip_item(item_type, p_list, window, algorithm):
+    """按图元类型裁剪，供命令行与图形界面的裁剪操作使用
+
+    多边形(含填充多边形)用Sutherland-Hodgman算法裁剪整个多边形，其余图元与原来一样由cg_algorithms.clip裁剪(线段)
+
+    :param item_type: (string) 图元类型
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 图元参数
+    :param window: (tuple of int: (x_min, y_min, x_max, y_max)) 裁剪窗口
+    :param algorithm: (string) 线段裁剪算法，包括'Cohen-Sutherland'和'Liang-Barsky'
+    :return: (list of list of int) 裁剪后的图元参数，完全在窗口外时为空列表
+    """
+    if item_type in ('polygon', 'filled_polygon'):
+        return clip_polygon(p_list, window).tolist()
+    return alg.clip(p_list, *window, algorithm)
+
+
+def _previous(counts):
+    """拼接后的顶点数组中，每个顶点在其所属多边形中的前一个顶点的下标(首顶点的前一个为末顶点)"""
+    total = int(counts.sum())
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    prev = np.arange(total) - 1
+    nonempty = counts > 0
+    prev[starts[nonempty]] = ends[nonempty] - 1
+    return prev, np.repeat(np.arange(len(counts)), counts)
+
+
+def clip_polygons(polygons, window):
+    """批量Sutherland-Hodgman多边形裁剪，依次用窗口的四条边裁剪，每条边上对所有多边形的所有顶点同时计算
+
+    :param polygons: (list of list of list of int) 多边形顶点坐标列表的列表
+    :param window: (tuple of int: (x_min, y_min, x_max, y_max)) 裁剪窗口
+    :return: (list of ndarray of int64: [M, 2], ndarray of bool: [N]) 保留下来的多边形，以及每个多边形是否保留
+    """
+    x_min, y_min, x_max, y_max = window
+    counts = np.array([len(p) for p in polygons], np.int64)
+    points = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in polygons] + [np.empty((0, 2))])
+    #(坐标轴, 边界值, 内侧方向)
+    for axis, bound, sign in [(0, x_min, 1), (0, x_max, -1), (1, y_min, 1), (1, y_max, -1)]:
+        prev_index, owner = _previous(counts)
+        prev = points[prev_index]
+        cur_in = (points[:, axis] - bound) * sign >= 0
+        prev_in = (prev[:, axis] - bound) * sign >= 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u = (bound - prev[:, axis]) / (points[:, axis] - prev[:, axis])
+            cross = prev + u[:, None] * (points - prev)
+        cross[:, axis] = bound
+        #每条边(prev -> cur)依次输出：穿过边界时的交点，以及位于内侧的cur
+        emit = np.stack([cur_in != prev_in, cur_in], axis=1)
+        counts = np.bincount(owner, weights=emit.sum(axis=1), minlength=len(counts)).astype(np.int64)
+        points = np.stack([cross, points], axis=1)[emit]
+    points = np.rint(points).astype(np.int64)
+    #去掉相邻的重复顶点；所有顶点都重合时保留一个
+    prev_index, owner = _previous(counts)
+    distinct = np.any(points != points[prev_index], axis=1)
+    degenerate = np.bincount(owner[distinct], minlength=len(counts)) == 0
+    starts = np.cumsum(counts) - counts
+    distinct[starts[degenerate & (counts > 0)]] = True
+    counts = np.bincount(owner[distinct], minlength=len(counts)).astype(np.int64)
+    keep = counts > 0
+    if not keep.any():
+        return [], keep
+    return np.split(points[distinct], np.cumsum(counts[keep])[:-1]), keep
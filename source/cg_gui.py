@@ -5,12 +5,18 @@ import math
 import numpy as np
 
 import sys
-import cg_algorithms as alg
+import cg_cache
+import cg_clip
+import cg_raster as raster
+from cg_transform import Affine
+from cg_spatial import GridIndex
+from cg_scene import SceneStore, TYPES, write_scene, read_scene
 from typing import Optional
 from PyQt5.QtWidgets import (
     QMessageBox,
     QInputDialog,
     QColorDialog,
+    QFileDialog,
     QApplication,
     QMainWindow,
     qApp,
@@ -22,8 +28,116 @@ from PyQt5.QtWidgets import (
     QWidget,
     QStyleOptionGraphicsItem
     )
-from PyQt5.QtGui import QPainter, QMouseEvent, QColor
-from PyQt5.QtCore import QRectF, Qt
+from PyQt5.QtGui import QPainter, QMouseEvent, QColor, QPolygon, QPen, QTransform
+from PyQt5.QtCore import QRectF, Qt, QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5 import sip
+
+
+def to_qpolygon(points):
+    """将坐标数组整体拷贝进QPolygon的存储区，不逐点构造QPoint
+
+    :param points: (ndarray of int: [N, 2]) 坐标
+    :return: (QPolygon) 包含N个点的QPolygon
+    """
+    points = np.ascontiguousarray(points, dtype=np.int32).reshape(-1, 2)
+    polygon = QPolygon(len(points))
+    if len(points):
+        buffer = polygon.data()
+        buffer.setsize(points.nbytes)
+        np.frombuffer(buffer, np.int32)[:] = points.ravel()
+    return polygon
+
+
+IDENTITY = Affine()     #各图元共用的恒等变换，Affine不会被原地修改
+NO_RASTER = (QPolygon(), QPolygon())    #尚未光栅化的图元共用的空结果，只会被整体替换
+
+
+def to_qtransform(transform):
+    """将Affine转换为QTransform(Qt作用于行向量)"""
+    m = transform.matrix
+    return QTransform(m[0, 0], m[1, 0], m[0, 1], m[1, 1], m[0, 2], m[1, 2])
+
+
+class RasterJob(QRunnable):
+    """
+    在后台线程中光栅化一个图元，只读取创建时复制的参数，不访问图元对象
+    """
+    class Signals(QObject):
+        finished = pyqtSignal(object)
+
+    def __init__(self, item, key, item_type, p_list, algorithm):
+        super().__init__()
+        self.item = item            # 只在主线程中使用
+        self.key = key
+        self.args = (item_type, [list(p) for p in p_list], algorithm)
+        self.cancelled = False
+        self.spans = self.pixels = None
+        self.signals = RasterJob.Signals()
+        self.setAutoDelete(False)   #由Python管理生命周期，取消时tryTake不会访问已释放的任务
+
+    def run(self):
+        if not self.cancelled:
+            self.spans = raster.rasterize_spans(*self.args)
+        if not self.cancelled:
+            self.pixels = raster.rasterize(*self.args)
+        self.signals.finished.emit(self)    #跨线程的信号在主线程中处理，取消的任务也发出，以便释放
+
+
+class RasterService(QObject):
+    """
+    后台光栅化服务：每个图元最多保留一个任务，新的请求会取消该图元尚未完成的旧任务
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() - 1))
+        self._jobs = {}             # 图元 -> 最新的任务
+        self._cancelled = set()     # 已取消但仍在运行的任务，结束前须保持引用
+
+    def request(self, item, key, p_list):
+        """请求光栅化图元的某一几何，完成后调用item.set_raster"""
+        old = self._jobs.get(item)
+        if old is not None:
+            if old.key == key:
+                return
+            self._cancel(old)
+        job = RasterJob(item, key, item.item_type, p_list, item.algorithm)
+        job.signals.finished.connect(self._finished)
+        self._jobs[item] = job
+        self.pool.start(job)
+
+    def _cancel(self, job):
+        #已开始的任务在下一步检查时退出，结果也会被丢弃
+        job.cancelled = True
+        if not self.pool.tryTake(job):
+            self._cancelled.add(job)
+
+    def cancel(self, item):
+        """取消图元尚未完成的任务，图元被删除前调用"""
+        job = self._jobs.pop(item, None)
+        if job is not None:
+            self._cancel(job)
+
+    def cancel_all(self):
+        """取消所有尚未完成的任务，清空画布前调用"""
+        for job in self._jobs.values():
+            self._cancel(job)
+        self._jobs.clear()
+
+    def _finished(self, job):
+        self._cancelled.discard(job)
+        if job.cancelled or self._jobs.get(job.item) is not job:
+            return
+        del self._jobs[job.item]
+        if sip.isdeleted(job.item):
+            return      #图元已随场景一起释放
+        item_type, p_list, algorithm = job.args
+        cg_cache.cache.put(item_type, p_list, algorithm, job.spans, job.pixels)
+        job.item.set_raster(job.key, job.spans, job.pixels)
+
+    def wait(self):
+        """等待所有任务完成(结果在主线程处理信号后才生效)"""
+        self.pool.waitForDone()
 
 
 class MyCanvas(QGraphicsView):
@@ -35,6 +149,8 @@ class MyCanvas(QGraphicsView):
         self.main_window = None
         self.list_widget = None
         self.item_dict = {}
+        self.index = GridIndex()    #图元包围盒的空间索引，用于点选(重绘区域内的图元由QGraphicsScene自身的BSP索引查找)
+        self.store = SceneStore()   #已完成图元的列式存储，图元的类型、参数、画法与颜色都从中读取
         self.selected_id = ''
 
         self.status = ''
@@ -42,12 +158,18 @@ class MyCanvas(QGraphicsView):
         self.temp_id = ''
         self.temp_item = None
         self.temp_color = QColor(0,0,0)
+        self.temp_fill = False
+        self.dirty_rect = QRectF()  #本次鼠标事件中被编辑图元修改前后的区域的并集
+        self.raster_service = RasterService(self)   #后台光栅化，图元显示最近一次完成的结果
 
     def reset(self, height,width):
         self.list_widget.clearSelection()
         self.list_widget.clear()
         self.item_dict = {}
+        self.index.clear()
+        self.store.clear()
         self.selected_id = ''
+        self.raster_service.cancel_all()
         self.scene().clear()
 
         self.status = ''
@@ -56,17 +178,28 @@ class MyCanvas(QGraphicsView):
         self.temp_item = None
         self.setFixedSize(height, width)
 
+    def load_scene(self, store):
+        """以载入的场景替换画布中的图元，store为cg_scene.read_scene的结果，图元直接读取其中的数据"""
+        self.store = store
+        for item_id in store.keys():
+            item = MyItem.from_store(item_id, store)
+            self.scene().addItem(item)
+            self.item_dict[item_id] = item
+            self.update_index(item_id)
+            self.list_widget.addItem(item_id)
+
     def start_draw_line(self, algorithm, item_id):
         self.status = 'line'
         self.temp_algorithm = algorithm
         self.temp_id = item_id
         self.temp_item = None
     
-    def start_draw_polygon(self, algorithm, item_id):
+    def start_draw_polygon(self, algorithm, item_id, fill=False):
         self.status = 'polygon'
         self.temp_algorithm = algorithm
         self.temp_id = item_id
         self.temp_item = None
+        self.temp_fill = fill
 
     def start_draw_curve(self, algorithm, item_id):
         self.status = 'curve'
@@ -74,8 +207,9 @@ class MyCanvas(QGraphicsView):
         self.temp_id = item_id
         self.temp_item = None
     
-    def start_draw_ellipse(self, item_id):
+    def start_draw_ellipse(self, item_id, fill=False):
         self.status = 'ellipse'
+        self.temp_fill = fill
         self.temp_id = item_id
         self.temp_item = None
 
@@ -96,6 +230,10 @@ class MyCanvas(QGraphicsView):
         self.temp_algorithm = algorithm
         self.temp_item = None
 
+    def start_select(self):
+        self.status = 'select'
+        self.temp_item = None
+
     def start_delete(self):
         self.status = 'delete'
         self.temp_item = None
@@ -107,10 +245,14 @@ class MyCanvas(QGraphicsView):
         else:
             #清除状态
             self.removeState()
-            #删除scene中的记录
+            #取消该图元尚未完成的光栅化，删除scene中的记录
+            self.raster_service.cancel(self.item_dict[target_id])
             self.scene().removeItem(self.item_dict[target_id])
-            #删除画布item字典中的记录
+            #删除画布item字典与空间索引中的记录
             del self.item_dict[target_id]
+            self.index.remove(target_id)
+            if target_id in self.store:
+                self.store.remove(target_id)
             #删除画布list_widget中的记录
             target_list=self.list_widget.findItems(target_id, Qt.MatchFlag.MatchExactly)
             target = target_list[0]
@@ -129,6 +271,23 @@ class MyCanvas(QGraphicsView):
         self.temp_item = None
 
 
+    def item_changed(self, item_id):
+        """图元绘制完成或几何改变后，将其写回列式存储并更新空间索引"""
+        self.item_dict[item_id].commit(self.store)
+        self.update_index(item_id)
+
+    def update_index(self, item_id):
+        """图元的几何改变后更新其在空间索引中的包围盒"""
+        rect = self.item_dict[item_id].boundingRect()
+        self.index.update(item_id, (rect.left(), rect.top(), rect.right(), rect.bottom()))
+
+    def pick(self, x, y, tolerance=3):
+        """点选：返回(x, y)附近最上层的图元id，没有时返回''"""
+        for item_id in self.index.query_point(x, y, tolerance):
+            if self.item_dict[item_id].hit(x, y, tolerance):
+                return item_id
+        return ''
+
     def finish_draw(self):
         self.main_window.inc_id()
         self.temp_id = self.main_window.get_id()
@@ -146,48 +305,79 @@ class MyCanvas(QGraphicsView):
         if selected !='' and self.item_dict:
             self.selected_id = selected
             self.item_dict[selected].selected = True
-            self.item_dict[selected].update()
+            self.item_dict[selected].update()     #只重绘新旧选中图元所在的区域
             self.status = ''
-            self.updateScene([self.sceneRect()])
+
+    def edited_items(self):
+        """当前鼠标事件可能修改的图元：正在绘制的图元(或裁剪框)与选中的图元"""
+        items = [self.temp_item, self.item_dict.get(self.selected_id)]
+        return [item for item in items if item is not None]
+
+    def begin_edit(self):
+        """在修改图元之前记录其区域；图元的几何真正改变时由MyItem自己调用prepareGeometryChange"""
+        for item in self.edited_items():
+            self.dirty_rect = self.dirty_rect.united(item.boundingRect())
+
+    def end_edit(self):
+        """只重绘被编辑图元修改前后区域的并集，而不是整个场景"""
+        for item in self.edited_items():
+            self.dirty_rect = self.dirty_rect.united(item.boundingRect())
+        if not self.dirty_rect.isEmpty():
+            self.updateScene([self.dirty_rect.adjusted(-2, -2, 2, 2)])     #包括选中框的边线
+        self.dirty_rect = QRectF()
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
         pos = self.mapToScene(event.localPos().toPoint())
         x = int(pos.x())
         y = int(pos.y())
-        if self.status == 'line':
+        self.begin_edit()
+        if self.status in ['', 'select']:
+            item_id = self.pick(x, y)
+            if item_id != '':
+                self.list_widget.setCurrentItem(self.list_widget.findItems(item_id, Qt.MatchFlag.MatchExactly)[0])
+            else:
+                self.list_widget.clearSelection()
+                self.clear_selection()
+            self.status = 'select'
+        elif self.status == 'line':
             self.temp_item = MyItem(self.temp_id, self.status, [[x, y], [x, y]], self.temp_algorithm,self.temp_color)
             self.scene().addItem(self.temp_item)
         elif self.status in ['polygon', 'curve']:
             if self.temp_item is None:
-                self.temp_item = MyItem(self.temp_id, self.status, [[x, y], [x, y]], self.temp_algorithm,self.temp_color)
+                item_type = 'filled_polygon' if self.status == 'polygon' and self.temp_fill else self.status
+                self.temp_item = MyItem(self.temp_id, item_type, [[x, y], [x, y]], self.temp_algorithm,self.temp_color)
                 self.scene().addItem(self.temp_item)
             else:
-                self.temp_item.p_list.append([x, y])
+                self.temp_item.add_point([x, y])
         elif self.status == 'ellipse':
-            self.temp_item = MyItem(self.temp_id, self.status, [[x, y], [x, y]], '',self.temp_color)
+            item_type = 'filled_ellipse' if self.temp_fill else self.status
+            self.temp_item = MyItem(self.temp_id, item_type, [[x, y], [x, y]], '',self.temp_color)
             self.scene().addItem(self.temp_item)
         elif self.status == 'translate':
             if self.selected_id != '':
                 self.old_pos = pos
-                self.old_p_list = self.item_dict[self.selected_id].p_list
+                self.old_transform = self.item_dict[self.selected_id].transform
+                self.item_dict[self.selected_id].previewing = True
         elif self.status == 'rotate':
             if self.selected_id != '':
                 self.centerPoint = self.item_dict[self.selected_id].getCenterPoint()
                 self.old_pos = pos
-                self.old_p_list = self.item_dict[self.selected_id].p_list
+                self.old_transform = self.item_dict[self.selected_id].transform
+                self.item_dict[self.selected_id].previewing = True
         elif self.status == 'scale':
             if self.selected_id != '':
                 self.centerPoint = self.item_dict[self.selected_id].getCenterPoint()
                 self.old_pos = pos
-                self.old_p_list = self.item_dict[self.selected_id].p_list
+                self.old_transform = self.item_dict[self.selected_id].transform
+                self.item_dict[self.selected_id].previewing = True
         elif self.status == 'clip':
             if self.selected_id != '':
                 self.temp_id=str(int(self.main_window.get_id())+1)
                 self.temp_item = MyItem(self.temp_id, 'polygon', [[x, y], [x, y]], 'DDA',self.temp_color)    #增加裁剪框
                 self.scene().addItem(self.temp_item)
                 self.old_pos = pos
-                self.old_p_list = self.item_dict[self.selected_id].p_list
-        self.updateScene([self.sceneRect()])
+                self.old_p_list = np.array(self.item_dict[self.selected_id].points()).tolist()
+        self.end_edit()
         super().mousePressEvent(event)
 
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
@@ -195,15 +385,17 @@ class MyCanvas(QGraphicsView):
         self.now_pos = pos
         x = int(pos.x())
         y = int(pos.y())
+        self.begin_edit()
         if self.status == 'line':
-            self.temp_item.p_list[1] = [x, y]
+            self.temp_item.set_point(1, [x, y])
         elif self.status in ['polygon','curve']:
-            self.temp_item.p_list[-1] = [x, y]
+            self.temp_item.set_point(-1, [x, y])
         elif self.status == 'ellipse':
-            self.temp_item.p_list[1] = [x, y]
+            self.temp_item.set_point(1, [x, y])
         elif self.status == 'translate':
             if self.selected_id != '':
-                self.item_dict[self.selected_id].p_list = alg.translate(self.old_p_list, x - int(self.old_pos.x()), dy = y - int(self.old_pos.y()))
+                #在按下鼠标时的变换上复合本次拖动的变换，图元参数本身不变，避免反复取整的误差累积
+                self.item_dict[self.selected_id].transform = self.old_transform.then(Affine.translation(x - int(self.old_pos.x()), y - int(self.old_pos.y())))
         elif self.status == 'rotate':
             if self.selected_id != '':
                 x0,y0=self.centerPoint[0],self.centerPoint[1]       #中心点
@@ -219,7 +411,7 @@ class MyCanvas(QGraphicsView):
                 cos_c_b =cos_c_x*cos_b_x+sin_c_x*sin_b_x            #点击点与移动点的夹角
                 d = math.asin(sin_c_b) if cos_c_b > 0 else math.pi-math.asin(sin_c_b)   #分为第一+第四象限、第二+第三象限两种情况
                 r = math.degrees(d)
-                self.item_dict[self.selected_id].p_list = alg.rotate(self.old_p_list,x0,y0, r)
+                self.item_dict[self.selected_id].transform = self.old_transform.then(Affine.rotation(x0, y0, r))
         elif self.status == 'scale':
             if self.selected_id != '':
                 x0,y0=self.centerPoint[0],self.centerPoint[1]       #中心点
@@ -228,45 +420,58 @@ class MyCanvas(QGraphicsView):
                 old_len = pow(pow(x1-x0,2)+pow(y1-y0,2),0.5)
                 new_len = pow(pow(x2-x0,2)+pow(y2-y0,2),0.5)
                 s = new_len/old_len
-                self.item_dict[self.selected_id].p_list = alg.scale(self.old_p_list,x0,y0, s)
+                self.item_dict[self.selected_id].transform = self.old_transform.then(Affine.scaling(x0, y0, s))
         elif self.status == 'clip':
             if self.selected_id != '':
                 x1,y1=round(self.old_pos.x()),round(self.old_pos.y())             #鼠标点击的点
                 x2,y2=x,y                                           #鼠标移动至的点,画出一个之间连线的临时的框
-                self.temp_item.p_list[0] = [x1, y1]
-                self.temp_item.p_list[1] = [x1, y2]
+                self.temp_item.set_point(0, [x1, y1])
+                self.temp_item.set_point(1, [x1, y2])
                 if len(self.temp_item.p_list) == 2:
-                    self.temp_item.p_list.append ([x2, y2])
-                    self.temp_item.p_list.append ([x2, y1])
+                    self.temp_item.add_point([x2, y2])
+                    self.temp_item.add_point([x2, y1])
                 else:
-                    self.temp_item.p_list[2]=[x2, y2]
-                    self.temp_item.p_list[3]=[x2, y1]
-        self.updateScene([self.sceneRect()])
+                    self.temp_item.set_point(2, [x2, y2])
+                    self.temp_item.set_point(3, [x2, y1])
+        self.end_edit()
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
+        self.begin_edit()
         if self.status == 'line':
             self.item_dict[self.temp_id] = self.temp_item
+            self.item_changed(self.temp_id)
             self.list_widget.addItem(self.temp_id)
             self.finish_draw()
         elif self.status in ['polygon','curve']:
             self.item_dict[self.temp_id] = self.temp_item
+            self.item_changed(self.temp_id)
             if not self.list_widget.findItems(self.temp_id, Qt.MatchFlag.MatchExactly):
                self.list_widget.addItem(self.temp_id)
         elif self.status == 'ellipse':
             self.item_dict[self.temp_id] = self.temp_item
+            self.item_changed(self.temp_id)
             self.list_widget.addItem(self.temp_id)
             self.finish_draw()
+        elif self.status in ['translate', 'rotate', 'scale']:
+            if self.selected_id != '':
+                self.item_dict[self.selected_id].previewing = False     #松开鼠标后才按所选算法重新光栅化
+                self.item_changed(self.selected_id)
         elif self.status == 'clip':
             if self.selected_id != '':
                 x_min,x_max = round(min(self.old_pos.x(),self.now_pos.x())),round(max(self.old_pos.x(),self.now_pos.x()))
                 y_min,y_max = round(min(self.old_pos.y(),self.now_pos.y())),round(max(self.old_pos.y(),self.now_pos.y()))
-                self.item_dict[self.selected_id].p_list = alg.clip(self.old_p_list,x_min,y_min,x_max,y_max, self.temp_algorithm)
+                item = self.item_dict[self.selected_id]
+                p_list = cg_clip.clip_item(item.item_type, self.old_p_list, (x_min,y_min,x_max,y_max), self.temp_algorithm)
                 self.scene().removeItem(self.temp_item)
-                if self.item_dict[self.selected_id].p_list == []:
+                if p_list == []:
                     self.delete_item(self.selected_id)
+                else:
+                    item.p_list = p_list
+                    item.transform = IDENTITY       #裁剪结果已是变换后的坐标
+                    self.item_changed(self.selected_id)
                 
-        self.updateScene([self.sceneRect()])
+        self.end_edit()
         super().mouseReleaseEvent(event)
 
 
@@ -274,98 +479,287 @@ class MyCanvas(QGraphicsView):
 class MyItem(QGraphicsItem):
     """
     自定义图元类，继承自QGraphicsItem
+
+    绘制完成的图元只保存id，类型、参数、画法与颜色都从所在画布的列式存储(store)中读取；
+    正在绘制或修改参数的图元使用一份草稿，松开鼠标时由commit写回存储
     """
     def __init__(self, item_id: str, item_type: str, p_list: list, algorithm: str = '', color = QColor(0,0,0),parent: QGraphicsItem = None):
         """
 
         :param item_id: 图元ID
-        :param item_type: 图元类型，'line'、'polygon'、'ellipse'、'curve'等
+        :param item_type: 图元类型，'line'、'polygon'、'filled_polygon'、'ellipse'、'filled_ellipse'、'curve'等
         :param p_list: 图元参数
         :param algorithm: 绘制算法，'DDA'、'Bresenham'、'Bezier'、'B-spline'等
         :param parent:
         """
         super().__init__(parent)
         self.id = item_id           # 图元ID
-        self.item_type = item_type  # 图元类型，'line'、'polygon'、'ellipse'、'curve'等
-        self.p_list = p_list        # 图元参数
-        self.algorithm = algorithm  # 绘制算法，'DDA'、'Bresenham'、'Bezier'、'B-spline'等
+        self.store = None           # 图元所在的列式存储，尚未写入时为None
+        self._scratch = [item_type, p_list, algorithm, color]  # 草稿(类型, 参数, 画法, 颜色)，图元只在存储中时为None
         self.selected = False
-        self.color = color
+        self._transform = IDENTITY  # 作用于图元参数的仿射变换，绘制时才对参数做变换，commit时写入参数
+        self._version = 0           # 图元参数的版本号，参数每改变一次加1
+        self._bounds = None         # 变换后图元参数的包围盒(x_min, y_min, x_max, y_max)，None表示需要重新计算
+        self._raster_key = None     # 正在显示的光栅化结果对应的几何
+        self._raster = NO_RASTER
+        self._raster_rect = None    # 正在显示的光栅化结果所占的区域，尚未光栅化时为None
+        self.previewing = False     # 拖动变换中：不重新光栅化，只对已有结果做变换后显示
+
+    @classmethod
+    def from_store(cls, item_id, store):
+        """已在列式存储中的图元，不复制其参数"""
+        item = cls(item_id, '', None)
+        item._scratch = None
+        item.store = store
+        return item
+
+    def _row(self):
+        return self.store.index[self.id]
+
+    @property
+    def item_type(self):
+        """图元类型，'line'、'polygon'、'filled_polygon'、'ellipse'、'filled_ellipse'、'curve'等"""
+        if self._scratch is not None:
+            return self._scratch[0]
+        return TYPES[self.store.type[self._row()]]
+
+    @property
+    def algorithm(self):
+        """绘制算法，'DDA'、'Bresenham'、'Bezier'、'B-spline'等"""
+        if self._scratch is not None:
+            return self._scratch[2]
+        return self.store.algorithms[self.store.algorithm[self._row()]]
+
+    @property
+    def color(self):
+        if self._scratch is not None:
+            return self._scratch[3]
+        return QColor(*self.store.color[self._row()].tolist())
+
+    @property
+    def p_list(self):
+        """图元参数(变换前)：草稿中的列表，或存储中顶点数组的视图；须通过赋值、add_point或set_point修改"""
+        if self._scratch is not None:
+            return self._scratch[1]
+        return self.store.points(self.id)
+
+    @p_list.setter
+    def p_list(self, p_list):
+        self.prepareGeometryChange()
+        self._checkout()
+        self._scratch[1] = p_list
+        self._version += 1
+        self._bounds = None
+
+    @property
+    def transform(self):
+        return self._transform
+
+    @transform.setter
+    def transform(self, transform):
+        self.prepareGeometryChange()
+        self._transform = transform
+        self._bounds = None
+
+    def _checkout(self):
+        """开始修改存储中的图元：把参数复制到草稿中，存储中的数据在commit之前保持不变"""
+        if self._scratch is None:
+            self._scratch = [self.item_type, self.store.points(self.id).tolist(), self.algorithm, self.color]
+
+    def commit(self, store):
+        """将草稿与尚未写入的变换写回存储，之后图元的数据只保存在存储中
+
+        变换写入参数后置为恒等变换；正在显示的光栅化结果改为相对新参数的变换，结果到达前仍可变换后显示
+        """
+        transform = self._transform
+        if self._scratch is not None or not transform.is_identity():
+            points = self.points()
+            if self._scratch is not None and (self.store is not store or self.id not in store):
+                item_type, _, algorithm, color = self._scratch
+                store.add(self.id, item_type, points, algorithm, (color.red(), color.green(), color.blue()))
+            else:
+                store.set_points(self.id, points)
+        self.store = store
+        self._scratch = None
+        if not transform.is_identity():
+            key = self.geometry_key()
+            self._transform = IDENTITY
+            self._version += 1
+            shown = self._raster_key
+            if shown is not None and shown[:3] == key[:3]:
+                #显示的结果在旧参数的shown[3]变换下得到，新参数即旧参数在transform下的结果
+                if shown == key:
+                    base = IDENTITY
+                else:
+                    base = Affine(np.frombuffer(shown[3])).inverse().then(transform).inverse()
+                self._raster_key = key[:2] + (self._version, base.matrix.tobytes())
+
+    def add_point(self, p):
+        """在参数末尾追加一个点，包围盒增量更新"""
+        self.prepareGeometryChange()
+        self._checkout()
+        self._scratch[1].append(p)
+        self._version += 1
+        if self._bounds is not None:
+            self._bounds = self._extend(self._bounds, self._transformed(p))
+
+    def set_point(self, i, p):
+        """修改第i个点；旧点在包围盒内部时增量更新，在边界上时包围盒留待下次使用时重新计算"""
+        self.prepareGeometryChange()
+        self._checkout()
+        p_list = self._scratch[1]
+        old = p_list[i]
+        p_list[i] = p
+        self._version += 1
+        if self._bounds is not None:
+            x, y = self._transformed(old)
+            x_min, y_min, x_max, y_max = self._bounds
+            if x_min < x < x_max and y_min < y < y_max:
+                self._bounds = self._extend(self._bounds, self._transformed(p))
+            else:
+                self._bounds = None
+
+    def _transformed(self, p):
+        if self._transform.is_identity():
+            return p
+        return self._transform.apply([p])[0].tolist()
+
+    @staticmethod
+    def _extend(bounds, p):
+        x_min, y_min, x_max, y_max = bounds
+        x, y = p
+        return min(x_min, x), min(y_min, y), max(x_max, x), max(y_max, y)
+
+    def bounds(self):
+        """(tuple of int: (x_min, y_min, x_max, y_max)) 变换后图元参数的包围盒，参数为空时为None"""
+        if self._bounds is None and len(self.p_list):
+            points = np.asarray(self.points()).reshape(-1, 2)
+            (x_min, y_min), (x_max, y_max) = points.min(axis=0).tolist(), points.max(axis=0).tolist()
+            self._bounds = x_min, y_min, x_max, y_max
+        return self._bounds
+
+    def points(self):
+        """变换后的图元参数；没有变换时直接返回p_list(存储中的图元为顶点数组的视图)"""
+        if self.transform.is_identity():
+            return self.p_list
+        return self.transform.apply(self.p_list)
+
+    def service(self):
+        """所在画布的后台光栅化服务，不在画布中时为None"""
+        scene = self.scene()
+        views = scene.views() if scene is not None else []
+        return getattr(views[0], 'raster_service', None) if views else None
+
+    def geometry_key(self):
+        #参数以版本号代替，不必每次绘制都遍历所有点
+        return self.item_type, self.algorithm, self._version, self.transform.matrix.tobytes()
+
+    def raster(self, key=None):
+        """图元的水平像素段与像素点，几何(参数、变换、画法)未变化时直接返回上次的结果
+
+        几何改变且光栅化缓存中没有结果时，交给后台线程计算，在结果到达前仍显示上一次完成的结果；预览时不重新光栅化
+
+        :return: (QPolygon, QPolygon) 水平像素段的端点对(x0, y), (x1, y)，以及像素点
+        """
+        if key is None:
+            key = self.geometry_key()
+        if key != self._raster_key and not self.previewing:
+            p_list = self.points()
+            cached = cg_cache.cache.peek(self.item_type, p_list, self.algorithm)
+            service = self.service()
+            if cached is None and service is not None:
+                service.request(self, key, p_list)
+            else:
+                spans, pixels = cached or (cg_cache.spans(self.item_type, p_list, self.algorithm),
+                                           cg_cache.rasterize(self.item_type, p_list, self.algorithm))
+                self.set_raster(key, spans, pixels)
+        return self._raster
+
+    def warp(self, key):
+        """显示的结果与当前几何只差一个变换时，返回把它映射到当前几何的变换；无需或无法映射时返回None"""
+        shown = self._raster_key
+        if shown is None or shown == key or shown[:3] != key[:3]:
+            return None
+        return Affine(np.frombuffer(shown[3])).inverse().then(self.transform)
+
+    def set_raster(self, key, spans, pixels):
+        """更换显示的光栅化结果，并重绘旧结果与新结果所占的区域"""
+        pairs = np.stack([spans[:, [1, 0]], spans[:, [2, 0]]], axis=1)
+        self._raster = (to_qpolygon(pairs), to_qpolygon(pixels))
+        self._raster_key = key
+        old_rect = self._raster_rect or QRectF()
+        points = np.concatenate([pairs.reshape(-1, 2), pixels]).astype(np.int32)
+        if len(points):
+            (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+            self._raster_rect = QRectF(int(x0), int(y0), int(x1 - x0) + 1, int(y1 - y0) + 1)
+        else:
+            self._raster_rect = QRectF()
+        if self.scene() is not None:
+            #旧结果可能曾被变换到当前几何的位置显示，一并重绘
+            self.scene().update(old_rect.united(self._raster_rect).united(self.boundingRect()))
 
     def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = ...) -> None:
         painter.setPen(self.color)
-        if self.item_type == 'line':
-            item_pixels = alg.draw_line(self.p_list, self.algorithm)
-            for p in item_pixels:
-                painter.drawPoint(*p)
-            if self.selected:
-                painter.setPen(QColor(255, 0, 0))
-                painter.drawRect(self.boundingRect())
-        elif self.item_type == 'polygon':
-            item_pixels = alg.draw_polygon(self.p_list, self.algorithm)
-            for p in item_pixels:
-                painter.drawPoint(*p)
-            if self.selected:
-                painter.setPen(QColor(255, 0, 0))
-                painter.drawRect(self.boundingRect())
-        elif self.item_type == 'ellipse':
-            item_pixels = alg.draw_ellipse(self.p_list)
-            for p in item_pixels:
-                painter.drawPoint(*p)
-            if self.selected:
-                painter.setPen(QColor(255, 0, 0))
-                painter.drawRect(self.boundingRect())
-        elif self.item_type == 'curve':
-            item_pixels = alg.draw_curve(self.p_list, self.algorithm)
-            for p in item_pixels:
-                painter.drawPoint(*p)
+        if self.item_type in ['line', 'polygon', 'filled_polygon', 'ellipse', 'filled_ellipse', 'curve']:
+            key = self.geometry_key()
+            lines, pixels = self.raster(key)
+            warp = self.warp(key)
+            if warp is not None and self.item_type in ['ellipse', 'filled_ellipse'] and (warp.matrix[0, 1] or warp.matrix[1, 0]):
+                #椭圆由变换后的包围框确定，始终与坐标轴对齐：旋转预览画出包围框所确定的椭圆，不旋转已有的结果
+                self.paint_ellipse_preview(painter)
+                return
+            if warp is not None:
+                #拖动预览，或新结果尚未完成：将已有的结果整体变换到当前位置，不运行光栅化算法
+                painter.save()
+                pen = QPen(self.color)
+                pen.setCosmetic(True)
+                painter.setPen(pen)
+                painter.setTransform(to_qtransform(warp), True)
+            painter.drawLines(lines)        #所有水平像素段一次画出
+            painter.drawPoints(pixels)      #所有像素点一次画出
+            if warp is not None:
+                painter.restore()
             if self.selected:
                 painter.setPen(QColor(255, 0, 0))
                 painter.drawRect(self.boundingRect())
 
+    def paint_ellipse_preview(self, painter: QPainter):
+        """以Qt的椭圆画出变换后参数所确定的椭圆，位于boundingRect之内"""
+        x_min, y_min, x_max, y_max = self.bounds()
+        pen = QPen(self.color)
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+        if self.item_type == 'filled_ellipse':
+            painter.setBrush(self.color)
+        painter.drawEllipse(QRectF(x_min, y_min, x_max - x_min, y_max - y_min))
+        if self.selected:
+            painter.setPen(QColor(255, 0, 0))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(self.boundingRect())
+
+    def hit(self, x, y, tolerance=3):
+        """(x, y)与图元的某个像素的距离(切比雪夫距离)是否不超过tolerance"""
+        p_list = self.points()
+        spans = cg_cache.spans(self.item_type, p_list, self.algorithm)
+        if np.any((np.abs(spans[:, 0] - y) <= tolerance) & (spans[:, 1] - tolerance <= x) & (spans[:, 2] + tolerance >= x)):
+            return True
+        pixels = cg_cache.rasterize(self.item_type, p_list, self.algorithm)
+        return bool(np.any((np.abs(pixels[:, 0] - x) <= tolerance) & (np.abs(pixels[:, 1] - y) <= tolerance)))
+
     def boundingRect(self) -> QRectF:
-        if self.p_list == []:
+        bounds = self.bounds()
+        if bounds is None:
             return QRectF(0,0,0,0)
-        if self.item_type in ['line','ellipse']:
-            x0, y0 = self.p_list[0]
-            x1, y1 = self.p_list[1]
-            x = min(x0, x1)
-            y = min(y0, y1)
-            w = max(x0, x1) - x
-            h = max(y0, y1) - y
-            return QRectF(x - 1, y - 1, w + 2, h + 2)
-        elif self.item_type in ['polygon','curve']:
-            x_min, y_min = self.p_list[0]
-            x_max, y_max = self.p_list[0]
-            for p in self.p_list:
-                    x_min = min(p[0],x_min)
-                    y_min = min(p[1],y_min)
-                    x_max = max(p[0],x_max)
-                    y_max = max(p[1],y_max)
-            w = x_max - x_min
-            h = y_max - y_min
-            return QRectF(x_min - 1, y_min - 1, w + 2, h + 2)
+        x_min, y_min, x_max, y_max = bounds
+        w = x_max - x_min
+        h = y_max - y_min
+        return QRectF(x_min - 1, y_min - 1, w + 2, h + 2)
 
     def getCenterPoint(self):
-        if self.item_type in ['line','ellipse']:
-            x0, y0 = self.p_list[0]
-            x1, y1 = self.p_list[1]
-            x = min(x0, x1)
-            y = min(y0, y1)
-            w = max(x0, x1) - x
-            h = max(y0, y1) - y
-            return int((x+w/2)),int((y+h/2))
-        elif self.item_type in ['polygon','curve']:
-            x_min, y_min = self.p_list[0]
-            x_max, y_max = self.p_list[0]
-            for p in self.p_list:
-                    x_min = min(p[0],x_min)
-                    y_min = min(p[1],y_min)
-                    x_max = max(p[0],x_max)
-                    y_max = max(p[1],y_max)
-            w = x_max - x_min
-            h = y_max - y_min
-            return int((x_min+w/2)),int((y_min+h/2))
+        x_min, y_min, x_max, y_max = self.bounds()
+        w = x_max - x_min
+        h = y_max - y_min
+        return int((x_min+w/2)),int((y_min+h/2))
 
 
 class MainWindow(QMainWindow):
@@ -376,7 +770,7 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.item_cnt = 0
 
-        # 使用QListWidget来记录已有的图元，并用于选择图元。注：这是图元选择的简单实现方法，更好的实现是在画布中直接用鼠标选择图元
+        # 使用QListWidget来记录已有的图元，并用于选择图元；也可以在画布中直接用鼠标点选图元
         self.list_widget = QListWidget(self)
         self.list_widget.setMinimumWidth(200)
 
@@ -393,6 +787,8 @@ class MainWindow(QMainWindow):
         file_menu = menubar.addMenu('文件')
         set_pen_act = file_menu.addAction('设置画笔')
         reset_canvas_act = file_menu.addAction('重置画布')
+        open_scene_act = file_menu.addAction('打开场景')
+        save_scene_act = file_menu.addAction('保存场景')
         exit_act = file_menu.addAction('退出')
         draw_menu = menubar.addMenu('绘制')
         line_menu = draw_menu.addMenu('线段')
@@ -402,7 +798,9 @@ class MainWindow(QMainWindow):
         polygon_menu = draw_menu.addMenu('多边形')
         polygon_dda_act = polygon_menu.addAction('DDA')
         polygon_bresenham_act = polygon_menu.addAction('Bresenham')
+        polygon_fill_act = polygon_menu.addAction('扫描线填充')
         ellipse_act = draw_menu.addAction('椭圆')
+        ellipse_fill_act = draw_menu.addAction('填充椭圆')
         curve_menu = draw_menu.addMenu('曲线')
         curve_bezier_act = curve_menu.addAction('Bezier')
         curve_b_spline_act = curve_menu.addAction('B-spline')
@@ -413,11 +811,14 @@ class MainWindow(QMainWindow):
         clip_menu = edit_menu.addMenu('裁剪')
         clip_cohen_sutherland_act = clip_menu.addAction('Cohen-Sutherland')
         clip_liang_barsky_act = clip_menu.addAction('Liang-Barsky')
+        select_act = edit_menu.addAction('选择')
         delete_act = edit_menu.addAction('删除')
 
         # 连接信号和槽函数
         set_pen_act.triggered.connect(self.set_pen_action)
         reset_canvas_act.triggered.connect(self.reset_canvas_action)
+        open_scene_act.triggered.connect(self.open_scene_action)
+        save_scene_act.triggered.connect(self.save_scene_action)
         exit_act.triggered.connect(qApp.quit)#退出程序
         line_naive_act.triggered.connect(self.line_naive_action)#naive直线
         self.list_widget.currentTextChanged.connect(self.canvas_widget.selection_changed)#选定目标
@@ -425,14 +826,17 @@ class MainWindow(QMainWindow):
         line_bresenham_act.triggered.connect(self.line_bresenham_action)#bresenham直线
         polygon_dda_act.triggered.connect(self.polygon_dda_action)#dda 多边形
         polygon_bresenham_act.triggered.connect(self.polygon_bresenham_action)
+        polygon_fill_act.triggered.connect(self.polygon_fill_action)
         curve_bezier_act.triggered.connect(self.curve_bezier_action)
         curve_b_spline_act.triggered.connect(self.curve_b_spline_action)
         ellipse_act.triggered.connect(self.ellipse_action)
+        ellipse_fill_act.triggered.connect(self.ellipse_fill_action)
         translate_act.triggered.connect(self.translate_action)
         rotate_act.triggered.connect(self.rotate_action)
         scale_act.triggered.connect(self.scale_action)
         clip_cohen_sutherland_act.triggered.connect(self.clip_cohen_sutherland_action)
         clip_liang_barsky_act.triggered.connect(self.clip_liang_barsky_action)
+        select_act.triggered.connect(self.select_action)
         delete_act.triggered.connect(self.delete_action)
 
         # 设置主窗口的布局
@@ -472,6 +876,39 @@ class MainWindow(QMainWindow):
         else:
             QMessageBox(QMessageBox.Information, '提示', '修改失败').exec_()
 
+    def open_scene_action(self):
+        path, _ = QFileDialog.getOpenFileName(self, '打开场景', '', '场景文件 (*.scene)')
+        if not path:
+            return
+        try:
+            store, width, height = read_scene(path)
+        except (OSError, ValueError) as e:
+            QMessageBox(QMessageBox.Warning, '提示', '打开失败: %s' % e).exec_()
+            return
+        if width <= 0 or height <= 0:
+            rect = self.scene.sceneRect()
+            width, height = int(rect.width()), int(rect.height())
+        self.list_widget.clearSelection()
+        self.list_widget.clear()
+        self.scene.setSceneRect(0, 0, width, height)
+        self.canvas_widget.reset(width, height)
+        self.canvas_widget.load_scene(store)
+        #新图元的id接在已有的数字id之后
+        self.item_cnt = max([int(i) + 1 for i in store.keys() if i.isdigit()], default=0)
+        self.statusBar().showMessage('已打开场景: %s' % path)
+
+    def save_scene_action(self):
+        path, _ = QFileDialog.getSaveFileName(self, '保存场景', '', '场景文件 (*.scene)')
+        if not path:
+            return
+        rect = self.scene.sceneRect()
+        try:
+            write_scene(path, self.canvas_widget.store, int(rect.width()), int(rect.height()))
+        except (OSError, ValueError) as e:
+            QMessageBox(QMessageBox.Warning, '提示', '保存失败: %s' % e).exec_()
+            return
+        self.statusBar().showMessage('已保存场景: %s' % path)
+
 
     def line_naive_action(self):
         self.canvas_widget.start_draw_line('Naive', self.get_id())
@@ -505,6 +942,13 @@ class MainWindow(QMainWindow):
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
 
+    def polygon_fill_action(self):
+        self.canvas_widget.start_draw_polygon('Bresenham', self.get_id(), fill=True)
+        self.inc_id()
+        self.statusBar().showMessage('扫描线算法填充多边形')
+        self.list_widget.clearSelection()
+        self.canvas_widget.clear_selection()
+
     def curve_bezier_action(self):
         self.canvas_widget.start_draw_curve('Bezier', self.get_id())
         self.inc_id()
@@ -525,6 +969,12 @@ class MainWindow(QMainWindow):
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
 
+    def ellipse_fill_action(self):
+        self.canvas_widget.start_draw_ellipse(self.get_id(), fill=True)
+        self.statusBar().showMessage('中点圆算法填充椭圆')
+        self.list_widget.clearSelection()
+        self.canvas_widget.clear_selection()
+
     def translate_action(self):
         self.canvas_widget.start_draw_translate()
         self.statusBar().showMessage('平移变换')
@@ -545,6 +995,10 @@ class MainWindow(QMainWindow):
         self.canvas_widget.start_draw_clip('Liang-Barsky')
         self.statusBar().showMessage('梁友栋-Barsky裁剪算法')
 
+    def select_action(self):
+        self.canvas_widget.start_select()
+        self.statusBar().showMessage('点选图元')
+
     def delete_action(self):
         self.canvas_widget.start_delete()
         self.statusBar().showMessage('删除图元')
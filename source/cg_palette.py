@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 调色板画布：每个像素只保存一个字节的颜色下标，颜色表由setColor用到的颜色构成，输出为8位bmp或png
+import numpy as np
+from PIL import Image
+from cg_canvas import Canvas
+import cg_bmp
+
+
+class PaletteOverflow(ValueError):
+    """颜色超过调色板的容量(256种)"""
+
+
+class Palette:
+    """
+    最多256种颜色的颜色表，下标0为白色背景
+    """
+    def __init__(self):
+        self.colors = [(255, 255, 255)]
+        self._index = {(255, 255, 255): 0}
+
+    def index(self, color):
+        """返回颜色的下标，新颜色追加到表尾
+
+        :param color: (array_like of int: [3]) RGB颜色
+        :return: (int) 颜色下标
+        """
+        color = tuple(int(c) for c in color)
+        index = self._index.get(color)
+        if index is None:
+            if len(self.colors) == 256:
+                raise PaletteOverflow('palette overflow: more than 256 colors, use the RGB canvas')
+            index = self._index[color] = len(self.colors)
+            self.colors.append(color)
+        return index
+
+    def array(self):
+        """(ndarray of uint8: [N, 3]) 颜色表"""
+        return np.array(self.colors, np.uint8).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.colors)
+
+
+class IndexedCanvas(Canvas):
+    """
+    调色板画布，buffer为[height, width]的uint8颜色下标；items中仍保存RGB颜色，写入画布时换为下标
+    """
+    background = 0
+
+    def reset(self, width, height):
+        super().reset(width, height)
+        self.palette = Palette()
+
+    def load(self, items, width, height):
+        super().load(items, width, height)
+        #按颜色在绘制顺序中首次出现的次序建立颜色表
+        colors = items.color[items.live_rows()]
+        _, first = np.unique(colors, axis=0, return_index=True)
+        for i in np.sort(first):
+            self.palette.index(colors[i])
+
+    def set_item(self, item_id, item_type, p_list, algorithm, color):
+        self.palette.index(color)       #按setColor的使用顺序建立颜色表，颜色过多时尽早报错
+        super().set_item(item_id, item_type, p_list, algorithm, color)
+
+    def set_color(self, item_id, color):
+        self.palette.index(color)
+        super().set_color(item_id, color)
+
+    def _pixel_value(self, color):
+        return self.palette.index(color)
+
+    def _allocate(self):
+        return np.empty([self.height, self.width], np.uint8)
+
+    def save(self, path, fmt='bmp'):
+        """合成画布并保存为8位调色板图像
+
+        :param path: (string) 文件路径
+        :param fmt: (string) 'bmp'或'png'
+        """
+        indices = self.render()
+        if fmt == 'bmp':
+            cg_bmp.write_bmp_indexed(path, indices, self.palette.array())
+        elif fmt == 'png':
+            image = Image.fromarray(indices, 'P')
+            image.putpalette(self.palette.array().tobytes())
+            image.save(path, 'png')
+        else:
+            raise ValueError('unknown image format: %s' % fmt)
@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 基于numpy的批量光栅化，结果与cg_algorithms中的逐点实现逐像素一致
+import math
+import numpy as np
+import cg_algorithms as alg
+
+
+def _as_segments(segments):
+    """将线段参数整理为int64数组
+
+    :param segments: (array_like of int: [N, 2, 2]) N条线段的起点和终点坐标
+    :return: (ndarray of int64: [N, 2, 2])
+    """
+    segments = np.asarray(segments, dtype=np.int64)
+    if segments.size == 0:
+        return segments.reshape(0, 2, 2)
+    return segments.reshape(-1, 2, 2)
+
+
+def _offsets(counts):
+    """由每段像素个数得到前缀偏移，第i段像素位于offsets[i]:offsets[i+1]"""
+    offsets = np.zeros(len(counts) + 1, np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _accumulate(start, inc, counts, offsets):
+    """逐段累加 start, start+inc, (start+inc)+inc, ...
+
+    与scalar实现中 `x = x + inc` 的浮点累加顺序完全相同，因此取整结果一致。
+    按长度分桶(2的幂)后在二维数组上沿行cumsum，填充浪费不超过一倍。
+    """
+    total = int(offsets[-1])
+    result = np.empty(total, np.float64)
+    if total == 0:
+        return result
+    bucket = np.ceil(np.log2(np.maximum(counts, 1))).astype(np.int64)
+    for b in np.unique(bucket):
+        idx = np.nonzero((bucket == b) & (counts > 0))[0]
+        if len(idx) == 0:
+            continue
+        length = int(counts[idx].max())
+        acc = np.empty((len(idx), length), np.float64)
+        acc[:, 0] = start[idx]
+        acc[:, 1:] = inc[idx, None]
+        np.cumsum(acc, axis=1, out=acc)
+        col = np.arange(length)
+        mask = col[None, :] < counts[idx, None]
+        pos = offsets[idx, None] + col[None, :]
+        result[pos[mask]] = acc[mask]
+    return result
+
+
+def _ramp(counts, offsets):
+    """每段内的序号 0, 1, ..., counts[i]-1 拼接而成的数组"""
+    total = int(offsets[-1])
+    seg = np.repeat(np.arange(len(counts)), counts)
+    return np.arange(total, dtype=np.int64) - offsets[seg], seg
+
+
+def draw_lines(segments, algorithm):
+    """批量绘制线段
+
+    :param segments: (array_like of int: [N, 2, 2]) N条线段的起点和终点坐标
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'、'Bresenham'和'Naive'
+    :return: (ndarray of int32: [M, 2], ndarray of int64: [N+1]) 所有线段的像素点坐标，
+             以及偏移数组，第i条线段的像素为 pixels[offsets[i]:offsets[i+1]]，顺序与cg_algorithms.draw_line相同
+    """
+    segments = _as_segments(segments)
+    x0, y0 = segments[:, 0, 0], segments[:, 0, 1]
+    x1, y1 = segments[:, 1, 0], segments[:, 1, 1]
+    dx, dy = x1 - x0, y1 - y0
+    if algorithm == 'Naive':
+        return _draw_lines_naive(x0, y0, x1, y1)
+    if algorithm not in ('DDA', 'Bresenham'):
+        raise ValueError('unknown line algorithm: %s' % algorithm)
+
+    counts = np.maximum(np.abs(dx), np.abs(dy)) + 1
+    offsets = _offsets(counts)
+    i, seg = _ramp(counts, offsets)
+    xstep = np.where(dx >= 0, 1, -1)
+    ystep = np.where(dy >= 0, 1, -1)
+
+    if algorithm == 'DDA':
+        vertical = dx == 0
+        k = dy / np.where(vertical, 1, dx)
+        y_major = vertical | (np.abs(k) >= 1)      #垂直线与斜率大于等于1的直线，沿y方向步进
+        with np.errstate(divide='ignore'):
+            inc = np.where(y_major, (1 / k) * ystep, k * xstep)
+        inc[vertical] = 0
+        start = np.where(y_major, x0, y0).astype(np.float64)
+        minor = np.rint(_accumulate(start, inc, counts, offsets)).astype(np.int64)
+        y_major = y_major[seg]
+        major = np.where(y_major, y0[seg] + i * ystep[seg], x0[seg] + i * xstep[seg])
+        xs = np.where(y_major, minor, major)
+        ys = np.where(y_major, major, minor)
+    else:
+        #Bresenham: 第i步时次方向的累计步数c_i = floor((2*dminor*i + dmajor) / (2*dmajor))，与决策变量的迭代等价
+        adx, ady = np.abs(dx), np.abs(dy)
+        x_major = (ady <= adx)[seg]
+        dmajor = np.maximum(adx, ady)[seg]
+        dminor = np.minimum(adx, ady)[seg]
+        c = (2 * dminor * i + dmajor) // np.maximum(2 * dmajor, 1)
+        xs = x0[seg] + xstep[seg] * np.where(x_major, i, c)
+        ys = y0[seg] + ystep[seg] * np.where(x_major, c, i)
+
+    pixels = np.empty((len(xs), 2), np.int32)
+    pixels[:, 0] = xs
+    pixels[:, 1] = ys
+    return pixels, offsets
+
+
+def _draw_lines_naive(x0, y0, x1, y1):
+    """Naive算法的批量版本，与draw_line(..., 'Naive')一致(包括竖直且y0>y1时不输出像素)"""
+    vertical = x0 == x1
+    swap = ~vertical & (x0 > x1)
+    x0, x1 = np.where(swap, x1, x0), np.where(swap, x0, x1)
+    y0, y1 = np.where(swap, y1, y0), np.where(swap, y0, y1)
+    counts = np.where(vertical, np.maximum(y1 - y0 + 1, 0), x1 - x0 + 1)
+    offsets = _offsets(counts)
+    i, seg = _ramp(counts, offsets)
+    k = (y1 - y0) / np.where(vertical, 1, x1 - x0)
+    v = vertical[seg]
+    pixels = np.empty((len(i), 2), np.int32)
+    pixels[:, 0] = np.where(v, x0[seg], x0[seg] + i)
+    pixels[:, 1] = np.where(v, y0[seg] + i, np.trunc(y0[seg] + k[seg] * i))
+    return pixels, offsets
+
+
+def polygon_segments(p_list):
+    """多边形的边，顺序与cg_algorithms.draw_polygon相同(从[p[-1], p[0]]开始)
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 多边形的顶点坐标列表
+    :return: (ndarray of int64: [N, 2, 2])
+    """
+    points = np.asarray(p_list, dtype=np.int64).reshape(-1, 2)
+    return np.stack([np.roll(points, 1, axis=0), points], axis=1)
+
+
+def draw_polygon(p_list, algorithm):
+    """绘制多边形，结果与cg_algorithms.draw_polygon相同
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 多边形的顶点坐标列表
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :return: (ndarray of int32: [M, 2]) 绘制结果的像素点坐标
+    """
+    return draw_lines(polygon_segments(p_list), algorithm)[0]
+
+
+def connect_points(points):
+    """将曲线采样点取整并连接成连通的像素序列，相邻重复的像素只保留一个
+
+    :param points: (ndarray of float: [m, 2]) 按顺序排列的采样点
+    :return: (ndarray of int32: [M, 2]) 8连通的像素点坐标
+    """
+    pixels = np.rint(points).astype(np.int64).reshape(-1, 2)
+    if len(pixels) > 1:
+        keep = np.ones(len(pixels), bool)
+        keep[1:] = np.any(pixels[1:] != pixels[:-1], axis=1)
+        pixels = pixels[keep]
+    if len(pixels) <= 1:
+        return pixels.astype(np.int32)
+    #相邻像素间用Bresenham直线补齐，每段去掉终点(即下一段的起点)
+    lines, offsets = draw_lines(np.stack([pixels[:-1], pixels[1:]], axis=1), 'Bresenham')
+    keep = np.ones(len(lines), bool)
+    keep[offsets[1:] - 1] = False
+    return np.concatenate([lines[keep], pixels[-1:].astype(np.int32)])
+
+
+def _chebyshev_length(points):
+    """折线在max(|dx|,|dy|)意义下的长度，即连通地画出这条折线所需的像素数"""
+    if len(points) < 2:
+        return 0
+    return float(np.abs(np.diff(points, axis=0)).max(axis=1).sum())
+
+
+def bezier_points(p_list, t):
+    """计算Bezier曲线在参数t处的点(Bernstein基的Horner形式，对t向量化)
+
+    B(t) = (1-t)^n * sum(C(n,i) * P_i * s^i), s = t/(1-t)，t > 0.5时对反序的控制点计算1-t，保证s <= 1
+
+    C(n,i)与(1-t)^n在n超过BEZIER_HORNER_MAX时超出双精度范围，改用对数空间的Bernstein权值，见_bezier_points_log
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 控制点坐标列表
+    :param t: (ndarray of float: [m]) 参数，取值范围[0, 1]
+    :return: (ndarray of float: [m, 2]) 曲线上的点
+    """
+    points = np.asarray(p_list, dtype=np.float64).reshape(-1, 2)
+    t = np.asarray(t, dtype=np.float64)
+    n = len(points) - 1
+    if n > BEZIER_HORNER_MAX:
+        return _bezier_points_log(points, t)
+    binom = np.array([float(math.comb(n, i)) for i in range(n + 1)])
+    result = np.empty((len(t), 2), np.float64)
+    low = t <= 0.5
+    for mask, ctrl, u in ((low, points, t[low]), (~low, points[::-1], 1 - t[~low])):
+        s = (u / (1 - u))[:, None]
+        acc = np.empty((len(u), 2), np.float64)
+        acc[:] = binom[n] * ctrl[n]
+        for i in range(n - 1, -1, -1):
+            acc *= s
+            acc += binom[i] * ctrl[i]
+        result[mask] = acc * ((1 - u) ** n)[:, None]
+    return result
+
+
+BEZIER_HORNER_MAX = 1000    #C(1000, 500)约为2.7e299，0.5^1000约为9.3e-302，仍在双精度的正常范围内
+
+
+def _bezier_points_log(points, t, chunk=1 << 20):
+    """控制点很多时计算Bezier曲线上的点：Bernstein权值在对数空间中求出再取指数，分批计算以限制[m, n+1]权值矩阵的大小
+
+    log b_i(t) = log C(n,i) + i*log(t) + (n-i)*log(1-t)，其中log C(n,i)由相邻二项式系数之比累加得到
+
+    :param points: (ndarray of float: [n+1, 2]) 控制点
+    :param t: (ndarray of float: [m]) 参数，取值范围[0, 1]
+    :param chunk: (int) 每批权值矩阵的元素数上限
+    :return: (ndarray of float: [m, 2]) 曲线上的点
+    """
+    n = len(points) - 1
+    i = np.arange(n + 1)
+    log_binom = np.zeros(n + 1)
+    np.cumsum(np.log((n - i[:-1]) / (i[:-1] + 1)), out=log_binom[1:])
+    result = np.empty((len(t), 2), np.float64)
+    step = max(1, chunk // (n + 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(t), step):
+            u = t[start:start + step, None]
+            #t为0或1时log为-inf，指数为0的项(0 * -inf)按0计
+            log_w = (log_binom + np.where(i > 0, i * np.log(u), 0)
+                     + np.where(i < n, (n - i) * np.log1p(-u), 0))
+            result[start:start + step] = np.exp(log_w) @ points
+    return result
+
+
+def draw_bezier(p_list):
+    """绘制Bezier曲线，采样数随曲线长度自适应
+
+    曲线长度不超过控制多边形长度；控制点较多时曲线远短于控制多边形，先粗采样估计曲线长度再按其两倍采样
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 控制点坐标列表
+    :return: (ndarray of int32: [M, 2]) 连通且相邻不重复的像素点坐标
+    """
+    points = np.asarray(p_list, dtype=np.float64).reshape(-1, 2)
+    if len(points) <= 1:
+        return connect_points(points)
+    samples = int(math.ceil(_chebyshev_length(points))) + 1
+    coarse = 16 * len(points)
+    if samples > coarse:
+        estimate = _chebyshev_length(bezier_points(points, np.linspace(0, 1, coarse)))
+        samples = min(samples, int(math.ceil(2 * estimate)) + 1)
+    return connect_points(bezier_points(points, np.linspace(0, 1, max(samples, 2))))
+
+
+def draw_b_spline(p_list):
+    """绘制三次均匀B样条曲线，所有段一次性求值，结果与cg_algorithms.draw_curve(..., 'B-spline')相同
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 控制点坐标列表
+    :return: (ndarray of int32: [M, 2]) 连通且相邻不重复的像素点坐标
+    """
+    points = np.asarray(p_list, dtype=np.int64).reshape(-1, 2)
+    segments = len(points) - 3
+    if segments <= 0:
+        return np.empty((0, 2), np.int32)
+    #每段采样数取相邻控制点间距的最大值，保证相邻采样点距离不超过1个像素
+    edges = np.abs(np.diff(points, axis=0)).max(axis=1)
+    m = np.maximum(np.maximum(np.maximum(edges[:-2], edges[1:-1]), edges[2:]), 1)
+    counts = m.copy()
+    counts[-1] += 1                                     #最后一段包含t=1
+    offsets = _offsets(counts)
+    j, seg = _ramp(counts, offsets)
+    t = j / m[seg]
+    u = 1 - t
+    t2 = t * t
+    t3 = t2 * t
+    b0, b1, b2, b3 = u*u*u / 6, (3*t3 - 6*t2 + 4) / 6, (-3*t3 + 3*t2 + 3*t + 1) / 6, t3 / 6
+    ctrl = points.astype(np.float64)
+    samples = (b0[:, None] * ctrl[seg] + b1[:, None] * ctrl[seg + 1]
+               + b2[:, None] * ctrl[seg + 2] + b3[:, None] * ctrl[seg + 3])
+    return connect_points(samples)
+
+
+def fill_polygon(p_list):
+    """扫描线填充多边形，对所有边与扫描线的交点一次性求值，结果与cg_algorithms.fill_polygon相同
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 多边形的顶点坐标列表
+    :return: (ndarray of int64: [K, 3]) 水平像素段(y, x_start, x_end)，包含两端点
+    """
+    edges = polygon_segments(p_list)
+    edges = edges[edges[:, 0, 1] != edges[:, 1, 1]]           #去掉水平边
+    flip = edges[:, 0, 1] > edges[:, 1, 1]
+    edges[flip] = edges[flip, ::-1]
+    x0, y0 = edges[:, 0, 0], edges[:, 0, 1]
+    dx, dy = edges[:, 1, 0] - x0, edges[:, 1, 1] - y0
+    counts = dy
+    offsets = _offsets(counts)
+    j, seg = _ramp(counts, offsets)
+    y = y0[seg] + j
+    num = x0[seg] * dy[seg] + j * dx[seg]
+    den = dy[seg]
+    x_ceil = -(-num // den)
+    x_floor = num // den
+    order = np.lexsort((x_floor, x_ceil, num / den, y))
+    #每条扫描线上的交点个数为偶数，排序后两两配对
+    y, x_ceil, x_floor = y[order], x_ceil[order], x_floor[order]
+    spans = np.stack([y[0::2], x_ceil[0::2], x_floor[1::2]], axis=1)
+    return spans[spans[:, 1] <= spans[:, 2]]
+
+
+def rasterize(item_type, p_list, algorithm):
+    """光栅化一个图元
+
+    :param item_type: (string) 图元类型，'line'、'polygon'、'filled_polygon'、'ellipse'、'filled_ellipse'、'curve'
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 图元参数
+    :param algorithm: (string) 绘制算法
+    :return: (ndarray of int32: [M, 2]) 绘制结果的像素点坐标，不包括rasterize_spans中以水平像素段给出的部分
+    """
+    if item_type == 'line':
+        pixels = draw_lines([p_list], algorithm)[0]
+    elif item_type in ['polygon', 'filled_polygon']:
+        pixels = draw_polygon(p_list, algorithm)
+    elif item_type in ['ellipse', 'filled_ellipse']:
+        pixels = ()                     #椭圆全部以水平像素段输出
+    elif item_type == 'curve' and algorithm == 'Bezier':
+        pixels = draw_bezier(p_list)
+    elif item_type == 'curve' and algorithm == 'B-spline':
+        pixels = draw_b_spline(p_list)
+    elif item_type == 'curve':
+        pixels = alg.draw_curve(p_list, algorithm)
+    else:
+        raise ValueError('unknown item type: %s' % item_type)
+    return np.asarray(pixels, dtype=np.int32).reshape(-1, 2)
+
+
+def rasterize_spans(item_type, p_list, algorithm):
+    """图元中以水平像素段给出的部分(填充多边形的内部、椭圆)，其余图元返回空数组
+
+    :return: (ndarray of int32: [K, 3]) 水平像素段(y, x_start, x_end)，包含两端点
+    """
+    if item_type == 'filled_polygon':
+        spans = fill_polygon(p_list)
+    elif item_type in ['ellipse', 'filled_ellipse']:
+        spans = alg.ellipse_spans(p_list, fill=item_type == 'filled_ellipse')
+    else:
+        spans = ()
+    return np.asarray(spans, dtype=np.int32).reshape(-1, 3)
+
+
+def canvas_index(pixels, height, width):
+    """将像素坐标转换为画布数组下标(画布第0行对应y=height-1)，丢弃画布外的像素
+
+    :param pixels: (ndarray of int: [M, 2]) 像素点坐标
+    :return: (ndarray of intp: [K], ndarray of intp: [K]) 行下标与列下标
+    """
+    x = pixels[:, 0]
+    y = pixels[:, 1]
+    inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    if not inside.all():
+        x, y = x[inside], y[inside]
+    return (height - 1 - y).astype(np.intp), x.astype(np.intp)
+
+
+def fill_pixels(canvas, pixels, color):
+    """将像素一次性写入调用方提供的画布
+
+    :param canvas: (ndarray of uint8: [height, width, 3]) 画布
+    :param pixels: (ndarray of int: [M, 2]) 像素点坐标
+    :param color: (array_like of uint8: [3]) 颜色
+    """
+    rows, cols = canvas_index(pixels, canvas.shape[0], canvas.shape[1])
+    canvas[rows, cols] = color
+
+
+def canvas_spans(spans, height, width):
+    """将水平像素段转换为画布的行下标与列区间[c0, c1)，裁剪到画布内并丢弃空段
+
+    :param spans: (ndarray of int: [K, 3]) 水平像素段(y, x_start, x_end)
+    :return: (ndarray of intp: [K'], ndarray of intp: [K'], ndarray of intp: [K']) 行下标、起始列、结束列(不含)
+    """
+    y = spans[:, 0]
+    c0 = np.maximum(spans[:, 1], 0)
+    c1 = np.minimum(spans[:, 2] + 1, width)
+    keep = (y >= 0) & (y < height) & (c0 < c1)
+    return (height - 1 - y[keep]).astype(np.intp), c0[keep].astype(np.intp), c1[keep].astype(np.intp)
+
+
+def fill_rows(canvas, rows, c0, c1, color):
+    """每个像素段用一次切片赋值写入画布"""
+    for r, a, b in zip(rows.tolist(), c0.tolist(), c1.tolist()):
+        canvas[r, a:b] = color
+
+
+def fill_spans(canvas, spans, color):
+    """将水平像素段写入调用方提供的画布
+
+    :param canvas: (ndarray of uint8: [height, width, 3]) 画布
+    :param spans: (ndarray of int: [K, 3]) 水平像素段(y, x_start, x_end)
+    :param color: (array_like of uint8: [3]) 颜色
+    """
+    fill_rows(canvas, *canvas_spans(spans, canvas.shape[0], canvas.shape[1]), color)
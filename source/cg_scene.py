@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 列式存储的场景：所有图元的顶点存放在一个连续的int32数组中，类型、画法、颜色等按行存放在定长数组中；
+# 场景可保存为二进制文件，各列数组原样写入，载入时直接映射到内存
+import os
+import struct
+import numpy as np
+
+TYPES = ('line', 'polygon', 'filled_polygon', 'ellipse', 'filled_ellipse', 'curve')
+ALGORITHMS = ('', 'Naive', 'DDA', 'Bresenham', 'Bezier', 'B-spline')
+
+#场景文件头：标识、版本号、保留、画布宽高、行数、顶点数、画法名与id各占的字节数
+HEADER = struct.Struct('<4sHHIIqqqq')
+MAGIC = b'CGSC'
+VERSION = 1
+
+
+class SceneStore:
+    """
+    场景中的图元，按绘制顺序排列。每个图元占一行：顶点在vertices中的起点start与个数count、类型、画法、颜色；
+    id -> 行号的索引用于按id访问。删除图元只做标记(O(1))，失效的行与顶点过多时整体压缩
+
+    读取图元时返回的顶点与颜色是内部数组的视图，不做拷贝；调用方不应修改
+    """
+    def __init__(self, capacity=16, vertex_capacity=64):
+        self.vertices = np.empty([vertex_capacity, 2], np.int32)
+        self.vertex_count = 0
+        self.start = np.empty(capacity, np.int64)
+        self.count = np.empty(capacity, np.int32)
+        self.type = np.empty(capacity, np.uint8)
+        self.algorithm = np.empty(capacity, np.uint8)
+        self.color = np.empty([capacity, 3], np.uint8)
+        self.alive = np.zeros(capacity, bool)
+        self.rows = 0               #已使用的行数(包括已删除的行)
+        self.dead = 0               #已删除的行数
+        self._ids = []              #行号 -> id，已删除的行为None
+        self._index = {}            #id -> 行号
+        self._id_blob = None        #从文件载入的、尚未解码的id
+        self.algorithms = list(ALGORITHMS)
+        self._algorithm_code = {name: code for code, name in enumerate(self.algorithms)}
+        self._garbage = 0           #不再被任何图元使用的顶点数
+
+    @property
+    def ids(self):
+        """(list of string) 行号 -> id，已删除的行为None；从文件载入的场景在首次访问时才解码"""
+        if self._ids is None:
+            self._ids = self._id_blob.decode('utf-8').split('\n') if self.rows else []
+            self._id_blob = None
+        return self._ids
+
+    @ids.setter
+    def ids(self, ids):
+        self._ids = ids
+
+    @property
+    def index(self):
+        """(dict of string -> int) id -> 行号，从文件载入的场景在首次访问时才建立"""
+        if self._index is None:
+            self._index = {item_id: row for row, item_id in enumerate(self.ids) if item_id is not None}
+        return self._index
+
+    @index.setter
+    def index(self, index):
+        self._index = index
+
+    def _grow_rows(self):
+        capacity = max(2 * len(self.start), 16)
+        for name in ['start', 'count', 'type', 'algorithm', 'color', 'alive']:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], old.dtype)
+            new[:self.rows] = old[:self.rows]
+            setattr(self, name, new)
+
+    def _append_vertices(self, p_list):
+        points = np.asarray(p_list, dtype=np.int32).reshape(-1, 2)
+        if self.vertex_count + len(points) > len(self.vertices):
+            vertices = np.empty([max(2 * len(self.vertices), self.vertex_count + len(points)), 2], np.int32)
+            vertices[:self.vertex_count] = self.vertices[:self.vertex_count]
+            self.vertices = vertices
+        start = self.vertex_count
+        self.vertices[start:start + len(points)] = points
+        self.vertex_count += len(points)
+        return start, len(points)
+
+    def _code(self, algorithm):
+        code = self._algorithm_code.get(algorithm)
+        if code is None:
+            code = self._algorithm_code[algorithm] = len(self.algorithms)
+            self.algorithms.append(algorithm)
+        return code
+
+    def add(self, item_id, item_type, p_list, algorithm, color):
+        """加入图元；id已存在时原地替换，保持原有的绘制顺序
+
+        :param item_id: (string) 图元id
+        :param item_type: (string) 图元类型，见TYPES
+        :param p_list: (array_like of int: [N, 2]) 图元参数
+        :param algorithm: (string) 绘制算法
+        :param color: (array_like of int: [3]) RGB颜色
+        """
+        row = self.index.get(item_id)
+        if row is None:
+            if self.rows == len(self.start):
+                self._grow_rows()
+            row = self.rows
+            self.rows += 1
+            self.ids.append(item_id)
+            self.index[item_id] = row
+            self.alive[row] = True
+        else:
+            self._garbage += int(self.count[row])
+        self.start[row], self.count[row] = self._append_vertices(p_list)
+        self.type[row] = TYPES.index(item_type)
+        self.algorithm[row] = self._code(algorithm)
+        self.color[row] = color
+        self._maybe_compact()
+
+    def set_points(self, item_id, p_list):
+        """更新图元参数；顶点数不变时原地覆盖"""
+        row = self.index[item_id]
+        points = np.asarray(p_list, dtype=np.int32).reshape(-1, 2)
+        if len(points) == self.count[row]:
+            start = self.start[row]
+            self.vertices[start:start + len(points)] = points
+        else:
+            self._garbage += int(self.count[row])
+            self.start[row], self.count[row] = self._append_vertices(points)
+            self._maybe_compact()
+
+    def set_color(self, item_id, color):
+        self.color[self.index[item_id]] = color
+
+    def remove(self, item_id):
+        """删除图元：只标记该行失效，失效的行过多时再压缩"""
+        row = self.index.pop(item_id)
+        self.alive[row] = False
+        self.ids[row] = None
+        self.dead += 1
+        self._garbage += int(self.count[row])
+        self._maybe_compact()
+
+    __delitem__ = remove
+
+    def _maybe_compact(self):
+        if self.dead > max(len(self), 1024) or self._garbage > max(self.vertex_count // 2, 4096):
+            self.compact()
+
+    def compact(self):
+        """去掉已删除的行与不再使用的顶点，保持绘制顺序"""
+        rows = np.flatnonzero(self.alive[:self.rows])
+        counts = self.count[rows]
+        starts = self.start[rows]
+        offsets = np.zeros(len(rows) + 1, np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        #每个保留下来的顶点在原数组中的下标
+        source = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+        self.vertices = self.vertices[source] if len(source) else np.empty([64, 2], np.int32)
+        self.vertex_count = int(offsets[-1])
+        for name in ['count', 'type', 'algorithm', 'color', 'alive']:
+            setattr(self, name, getattr(self, name)[rows])
+        self.start = offsets[:-1].copy()
+        self.ids = [self.ids[row] for row in rows.tolist()]
+        self.index = {item_id: row for row, item_id in enumerate(self.ids)}
+        self.rows = len(rows)
+        self.dead = 0
+        self._garbage = 0
+
+    def clear(self):
+        self.__init__()
+
+    def copy(self):
+        """压缩后的拷贝，用于快照(如交给其他进程绘制)"""
+        store = SceneStore.__new__(SceneStore)
+        store.__dict__.update(self.__dict__)
+        for name in ['vertices', 'start', 'count', 'type', 'algorithm', 'color', 'alive']:
+            setattr(store, name, getattr(self, name).copy())
+        store.ids = list(self.ids)
+        store.index = dict(self.index)
+        store.algorithms = list(self.algorithms)
+        store._algorithm_code = dict(self._algorithm_code)
+        store.compact()
+        return store
+
+    def points(self, item_id):
+        """(ndarray of int32: [N, 2]) 图元参数，为vertices的视图"""
+        row = self.index[item_id]
+        start = self.start[row]
+        return self.vertices[start:start + self.count[row]]
+
+    def row_item(self, row):
+        """(tuple: (类型, 点, 画法, 颜色)) 按行号读取图元，行号可由live_rows等得到"""
+        start = self.start[row]
+        return (TYPES[self.type[row]], self.vertices[start:start + self.count[row]],
+                self.algorithms[self.algorithm[row]], self.color[row])
+
+    def __getitem__(self, item_id):
+        """(tuple: (类型, 点, 画法, 颜色)) 图元，点与颜色为内部数组的视图"""
+        return self.row_item(self.index[item_id])
+
+    def __contains__(self, item_id):
+        return item_id in self.index
+
+    def __len__(self):
+        return self.rows - self.dead
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """按绘制顺序排列的图元id"""
+        return [item_id for item_id in self.ids if item_id is not None]
+
+    def values(self):
+        return [self.row_item(row) for row in range(self.rows) if self.ids[row] is not None]
+
+    def items(self):
+        return [(self.ids[row], self.row_item(row)) for row in range(self.rows) if self.ids[row] is not None]
+
+    def live_rows(self):
+        """(ndarray of int64) 按绘制顺序排列的有效行号，可用于直接读取各列数组"""
+        return np.flatnonzero(self.alive[:self.rows])
+
+    def segments(self, rows=None):
+        """两点图元(直线等)的参数，供cg_raster.draw_lines等批量算法使用
+
+        各行的顶点在vertices中连续存放时(如依次加入的直线)返回vertices的视图，否则按行号取出，返回拷贝
+
+        :param rows: (ndarray of int) 行号，默认为所有直线
+        :return: (ndarray of int32: [K, 2, 2]) 每行的两个顶点
+        """
+        if rows is None:
+            rows = self.live_rows()
+            rows = rows[self.type[rows] == TYPES.index('line')]
+        starts = self.start[rows]
+        if len(starts) and starts[-1] - starts[0] == 2 * (len(starts) - 1) and np.all(np.diff(starts) == 2):
+            return self.vertices[starts[0]:starts[0] + 2 * len(starts)].reshape(-1, 2, 2)
+        index = starts[:, None] + np.arange(2)
+        return self.vertices[index]
+
+    def bounds(self, rows):
+        """各行顶点的包围盒，直接由vertices等列计算
+
+        :param rows: (ndarray of int) 行号，各行至少有一个顶点
+        :return: (ndarray of int32: [K, 4]) 每行的(x_min, y_min, x_max, y_max)
+        """
+        counts = self.count[rows].astype(np.int64)
+        offsets = np.zeros(len(rows) + 1, np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        result = np.empty([len(rows), 4], np.int32)
+        if len(rows):
+            source = np.repeat(self.start[rows] - offsets[:-1], counts) + np.arange(offsets[-1])
+            points = self.vertices[source]
+            result[:, :2] = np.minimum.reduceat(points, offsets[:-1])
+            result[:, 2:] = np.maximum.reduceat(points, offsets[:-1])
+        return result
+
+    def nbytes(self):
+        """各数组占用的字节数(不含id字符串)"""
+        return sum(getattr(self, name).nbytes for name in ['vertices', 'start', 'count', 'type', 'algorithm', 'color', 'alive'])
+
+
+def _aligned(offset):
+    return (offset + 7) // 8 * 8
+
+
+def _sections(rows, vertex_count):
+    """场景文件中各列数组的(名字, 类型, 形状)，按在文件中的顺序排列，每个数组从8字节对齐处开始"""
+    return [('start', np.int64, (rows,)), ('vertices', np.int32, (vertex_count, 2)), ('count', np.int32, (rows,)),
+            ('color', np.uint8, (rows, 3)), ('type', np.uint8, (rows,)), ('algorithm', np.uint8, (rows,))]
+
+
+def write_scene(path, store, width=0, height=0):
+    """将场景保存为二进制文件：文件头之后依次为各列数组(压缩后，按绘制顺序)、画法名与id，均以换行分隔
+
+    先写入临时文件再替换，已映射到内存的旧文件(如刚由read_scene载入的同名文件)不受影响
+
+    :param path: (string) 文件路径
+    :param store: (SceneStore) 场景
+    :param width: (int) 画布宽度
+    :param height: (int) 画布高度
+    """
+    if store.dead or store._garbage:
+        store = store.copy()
+    rows, vertex_count = store.rows, store.vertex_count
+    algorithms = '\n'.join(store.algorithms).encode('utf-8')
+    ids = '\n'.join(store.ids).encode('utf-8')
+    if ids.count(b'\n') != max(rows - 1, 0) or any('\n' in a for a in store.algorithms):
+        raise ValueError('图元id与画法名中不能含有换行符')
+    temp = path + '.tmp'
+    with open(temp, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, VERSION, 0, width, height, rows, vertex_count, len(algorithms), len(ids)))
+        for name, dtype, shape in _sections(rows, vertex_count):
+            fp.write(b'\0' * (_aligned(fp.tell()) - fp.tell()))
+            fp.write(np.ascontiguousarray(getattr(store, name)[:shape[0]], dtype).tobytes())
+        fp.write(algorithms)
+        fp.write(ids)
+    os.replace(temp, path)
+
+
+def read_scene(path):
+    """以写时复制方式映射场景文件，各列数组直接使用文件中的数据，不逐个解析图元；之后对场景的修改不会写回文件
+
+    :param path: (string) 文件路径
+    :return: (tuple: (SceneStore, int, int)) 场景、画布宽度与高度
+    """
+    data = np.memmap(path, np.uint8, 'c')
+    if len(data) < HEADER.size:
+        raise ValueError('不是场景文件: %s' % path)
+    magic, version, _, width, height, rows, vertex_count, algorithm_bytes, id_bytes = HEADER.unpack(data[:HEADER.size].tobytes())
+    if magic != MAGIC:
+        raise ValueError('不是场景文件: %s' % path)
+    if version != VERSION:
+        raise ValueError('不支持的场景文件版本: %d' % version)
+    store = SceneStore.__new__(SceneStore)
+    offset = HEADER.size
+    for name, dtype, shape in _sections(rows, vertex_count):
+        offset = _aligned(offset)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if offset + size > len(data):
+            raise ValueError('场景文件不完整: %s' % path)
+        setattr(store, name, np.asarray(data[offset:offset + size]).view(dtype).reshape(shape))
+        offset += size
+    if offset + algorithm_bytes + id_bytes > len(data):
+        raise ValueError('场景文件不完整: %s' % path)
+    algorithms = data[offset:offset + algorithm_bytes].tobytes().decode('utf-8').split('\n')
+    offset += algorithm_bytes
+    store.vertex_count = vertex_count
+    store.alive = np.ones(rows, bool)
+    store.rows = rows
+    store.dead = 0
+    store._ids = None
+    store._index = None
+    store._id_blob = data[offset:offset + id_bytes].tobytes()
+    store.algorithms = algorithms
+    store._algorithm_code = {name: code for code, name in enumerate(algorithms)}
+    store._garbage = 0
+    return store, width, height
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 图元包围盒的均匀网格索引，用于图形界面中的点选与区域查询
+import math
+
+
+class GridIndex:
+    """
+    均匀网格空间索引：每个格子记录与之相交的图元id，图元的包围盒为闭区间(x0, y0, x1, y1)
+    """
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self._cells = {}        #(i, j) -> 与格子相交的图元id集合
+        self._rects = {}        #id -> 包围盒
+        self._order = {}        #id -> 插入序号，序号大的图元位于上层
+        self._count = 0
+
+    def _cell_range(self, rect):
+        x0, y0, x1, y1 = rect
+        size = self.cell_size
+        return (math.floor(x0 / size), math.floor(y0 / size),
+                math.floor(x1 / size), math.floor(y1 / size))
+
+    def insert(self, item_id, rect):
+        """加入图元；id已存在时更新其包围盒，保持原有的上下次序
+
+        :param item_id: (string) 图元id
+        :param rect: (tuple of number: (x0, y0, x1, y1)) 包围盒，x0 <= x1，y0 <= y1
+        """
+        if item_id in self._rects:
+            self._unlink(item_id)
+        else:
+            self._order[item_id] = self._count
+            self._count += 1
+        self._rects[item_id] = rect
+        i0, j0, i1, j1 = self._cell_range(rect)
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                self._cells.setdefault((i, j), set()).add(item_id)
+
+    update = insert
+
+    def remove(self, item_id):
+        if item_id in self._rects:
+            self._unlink(item_id)
+            del self._rects[item_id]
+            del self._order[item_id]
+
+    def _unlink(self, item_id):
+        i0, j0, i1, j1 = self._cell_range(self._rects[item_id])
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                cell = self._cells[i, j]
+                cell.discard(item_id)
+                if not cell:
+                    del self._cells[i, j]
+
+    def query_rect(self, rect):
+        """与矩形相交的图元，按从下到上的次序排列
+
+        :param rect: (tuple of number: (x0, y0, x1, y1)) 查询矩形(闭区间)
+        :return: (list of string) 图元id
+        """
+        x0, y0, x1, y1 = rect
+        i0, j0, i1, j1 = self._cell_range(rect)
+        found = set()
+        cells = self._cells
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(cells):
+            #查询范围内的格子比非空格子还多时，直接遍历非空格子
+            candidates = [c for (i, j), c in cells.items() if i0 <= i <= i1 and j0 <= j <= j1]
+        else:
+            candidates = [cells[i, j] for i in range(i0, i1 + 1) for j in range(j0, j1 + 1) if (i, j) in cells]
+        for cell in candidates:
+            found.update(cell)
+        result = []
+        for item_id in found:
+            a0, b0, a1, b1 = self._rects[item_id]
+            if a0 <= x1 and x0 <= a1 and b0 <= y1 and y0 <= b1:
+                result.append(item_id)
+        result.sort(key=self._order.get)
+        return result
+
+    def query_point(self, x, y, tolerance=0):
+        """包围盒(外扩tolerance)包含点(x, y)的图元，按从上到下的次序排列"""
+        return self.query_rect((x - tolerance, y - tolerance, x + tolerance, y + tolerance))[::-1]
+
+    def rect(self, item_id):
+        return self._rects.get(item_id)
+
+    def clear(self):
+        self._cells.clear()
+        self._rects.clear()
+        self._order.clear()
+        self._count = 0
+
+    def __contains__(self, item_id):
+        return item_id in self._rects
+
+    def __len__(self):
+        return len(self._rects)
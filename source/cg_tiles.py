@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 分块并行光栅化：画布按tile_size划分为块，图元按包围盒分到与之相交的块中，
+# 各工作进程将块直接写入共享内存中的画布，块内保持图元的绘制顺序
+import os
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cg_raster as raster
+import cg_cache
+import cg_bmp
+
+
+def item_rows_cols(p_list, height):
+    """图元像素在画布上的行、列范围(含端点)，由控制点的包围盒外扩1个像素得到
+
+    直线、多边形的像素不超出顶点的包围盒，椭圆的参数即为外接矩形，Bezier与B样条曲线位于控制点的凸包内
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 图元参数
+    :param height: (int) 画布高度
+    :return: (tuple of int: (r0, r1, c0, c1)) 行范围[r0, r1]与列范围[c0, c1]
+    """
+    xs = [x for x, _ in p_list]
+    ys = [y for _, y in p_list]
+    return height - 2 - max(ys), height - min(ys), min(xs) - 1, max(xs) + 1
+
+
+def bin_items(width, height, items, tile_size):
+    """将图元分到与其包围盒相交的块中
+
+    :param items: (list of tuple: [(类型, 点, 画法, 颜色), ...]) 按绘制顺序排列的图元
+    :return: (list of tuple: [((r0, r1, c0, c1), [图元下标, ...]), ...]) 每个块的区域(不含r1、c1)及按绘制顺序排列的图元下标
+    """
+    rows = (height + tile_size - 1) // tile_size
+    cols = (width + tile_size - 1) // tile_size
+    bins = [[] for _ in range(rows * cols)]
+    for index, (_, p_list, _, _) in enumerate(items):
+        if len(p_list) == 0:
+            continue
+        r0, r1, c0, c1 = item_rows_cols(p_list, height)
+        r0, r1 = max(r0, 0), min(r1, height - 1)
+        c0, c1 = max(c0, 0), min(c1, width - 1)
+        if r0 > r1 or c0 > c1:     #完全在画布外
+            continue
+        for i in range(r0 // tile_size, r1 // tile_size + 1):
+            for j in range(c0 // tile_size, c1 // tile_size + 1):
+                bins[i * cols + j].append(index)
+    tiles = []
+    for i in range(rows):
+        for j in range(cols):
+            region = (i * tile_size, min((i + 1) * tile_size, height), j * tile_size, min((j + 1) * tile_size, width))
+            tiles.append((region, bins[i * cols + j]))
+    return tiles
+
+
+def item_index(item, height, width):
+    """光栅化图元并转换为画布下标，返回(行下标, 列下标, 像素段行下标, 起始列, 结束列)"""
+    item_type, p_list, algorithm, _ = item
+    rows, cols = raster.canvas_index(cg_cache.rasterize(item_type, p_list, algorithm), height, width)
+    return (rows, cols) + raster.canvas_spans(cg_cache.spans(item_type, p_list, algorithm), height, width)
+
+
+def render_tile(canvas, region, pixels, colors):
+    """绘制一个块：填白后按绘制顺序写入与之相交的图元
+
+    :param canvas: (ndarray of uint8: [height, width, 3]) 画布
+    :param region: (tuple of int: (r0, r1, c0, c1)) 块的区域，不含r1、c1
+    :param pixels: (list of tuple) 与块相交的图元的画布下标，同item_index的返回值
+    :param colors: (list of ndarray of uint8: [3]) 各图元的颜色
+    """
+    r0, r1, c0, c1 = region
+    tile = canvas[r0:r1, c0:c1]
+    tile.fill(255)
+    for (rows, cols, span_rows, s0, s1), color in zip(pixels, colors):
+        s0, s1 = np.maximum(s0, c0), np.minimum(s1, c1)
+        inside = (span_rows >= r0) & (span_rows < r1) & (s0 < s1)
+        raster.fill_rows(tile, span_rows[inside] - r0, s0[inside] - c0, s1[inside] - c0, color)
+        inside = (rows >= r0) & (rows < r1) & (cols >= c0) & (cols < c1)
+        tile[rows[inside] - r0, cols[inside] - c0] = color
+
+
+def render_tiles(name, width, height, items, tiles):
+    """在工作进程中依次绘制一组块，每个图元在本组内只光栅化一次
+
+    :param name: (string) 共享内存中画布的名字，画布为[height, width, 3]的uint8数组
+    :param items: (dict of int -> tuple: {下标: (类型, 点, 画法, 颜色)}) 与这组块相交的图元
+    :param tiles: (list of tuple: [((r0, r1, c0, c1), [图元下标, ...]), ...]) 各块的区域及按绘制顺序排列的图元下标
+    """
+    pixels = {index: item_index(item, height, width) for index, item in items.items()}
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        canvas = np.ndarray((height, width, 3), np.uint8, buffer=shm.buf)
+        for region, indices in tiles:
+            render_tile(canvas, region, [pixels[i] for i in indices], [items[i][3] for i in indices])
+        del canvas
+    finally:
+        shm.close()
+
+
+def render_shared(shm, width, height, items, pool, tile_size=1024):
+    """将图元分块绘制到共享内存中的画布
+
+    :param shm: (SharedMemory) 至少height * width * 3字节的共享内存
+    :param items: (list of tuple: [(类型, 点, 画法, 颜色), ...]) 按绘制顺序排列的图元
+    :param pool: (ProcessPoolExecutor) 进程池
+    :param tile_size: (int) 块的边长
+    """
+    tiles = bin_items(width, height, items, tile_size)
+    #相邻的块作为一个任务交给同一个进程，任务只携带与其相交的图元；任务数为进程数的数倍以均衡负载
+    size = max(1, len(tiles) // (4 * os.cpu_count()))
+    futures = []
+    for i in range(0, len(tiles), size):
+        group = tiles[i:i + size]
+        used = {index: items[index] for _, indices in group for index in indices}
+        futures.append(pool.submit(render_tiles, shm.name, width, height, used, group))
+    for future in futures:
+        future.result()
+
+
+def render_tiled(width, height, items, pool, tile_size=1024, path=None):
+    """分块并行绘制画布，结果与cg_canvas.Canvas.render逐像素相同
+
+    :param items: (list of tuple: [(类型, 点, 画法, 颜色), ...]) 按绘制顺序排列的图元
+    :param pool: (ProcessPoolExecutor) 进程池
+    :param tile_size: (int) 块的边长
+    :param path: (string) 给出时直接从共享内存保存为bmp文件，不复制画布，返回None
+    :return: (ndarray of uint8: [height, width, 3]) 画布
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(height * width * 3, 1))
+    try:
+        render_shared(shm, width, height, items, pool, tile_size)
+        canvas = np.ndarray((height, width, 3), np.uint8, buffer=shm.buf)
+        if path is None:
+            result = canvas.copy()
+        else:
+            cg_bmp.write_bmp(path, canvas)
+            result = None
+        del canvas
+    finally:
+        shm.close()
+        shm.unlink()
+    return result
+
+
+def make_pool(jobs=None):
+    """创建用于分块绘制的进程池，jobs默认为CPU核数"""
+    return ProcessPoolExecutor(jobs or os.cpu_count())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 3x3齐次坐标仿射变换，平移、旋转、缩放复合为一个矩阵，只在光栅化前对图元参数做一次变换
+import math
+import numpy as np
+
+
+class Affine:
+    """
+    仿射变换，matrix作用于列向量[x, y, 1]
+    """
+    def __init__(self, matrix=None):
+        self.matrix = np.eye(3) if matrix is None else np.asarray(matrix, dtype=np.float64).reshape(3, 3)
+
+    @classmethod
+    def translation(cls, dx, dy):
+        """平移变换，与cg_algorithms.translate相同"""
+        return cls([[1, 0, dx], [0, 1, dy], [0, 0, 1]])
+
+    @classmethod
+    def rotation(cls, x, y, r):
+        """绕(x, y)旋转r度，方向与cg_algorithms.rotate相同"""
+        d = math.radians(r)
+        c, s = math.cos(d), math.sin(d)
+        return cls([[c, -s, x - c * x + s * y], [s, c, y - s * x - c * y], [0, 0, 1]])
+
+    @classmethod
+    def scaling(cls, x, y, s):
+        """以(x, y)为中心缩放s倍，与cg_algorithms.scale相同"""
+        return cls([[s, 0, x - s * x], [0, s, y - s * y], [0, 0, 1]])
+
+    def then(self, other):
+        """先做本变换，再做other"""
+        return Affine(other.matrix @ self.matrix)
+
+    def __matmul__(self, other):
+        return Affine(self.matrix @ other.matrix)
+
+    def inverse(self):
+        return Affine(np.linalg.inv(self.matrix))
+
+    def is_identity(self):
+        return np.array_equal(self.matrix, np.eye(3))
+
+    def apply(self, p_list):
+        """对图元参数做变换并取整
+
+        :param p_list: (list of list of int: [[x0, y0], [x1, y1], ...]) 图元参数
+        :return: (ndarray of int64: [N, 2]) 变换后的图元参数
+        """
+        points = np.asarray(p_list, dtype=np.float64).reshape(-1, 2)
+        return np.rint(points @ self.matrix[:2, :2].T + self.matrix[:2, 2]).astype(np.int64)
+
+    def __repr__(self):
+        return 'Affine(%r)' % self.matrix.tolist()
+
+
+def transform_items(p_lists, transform):
+    """对多个图元的参数做同一个变换，所有点拼接后只做一次矩阵乘法
+
+    :param p_lists: (list of list of list of int) 多个图元的参数
+    :param transform: (Affine) 变换
+    :return: (list of ndarray of int64: [N_i, 2]) 变换后的各图元参数
+    """
+    if not p_lists:
+        return []
+    counts = [len(p) for p in p_lists]
+    points = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in p_lists])
+    return np.split(transform.apply(points), np.cumsum(counts)[:-1])
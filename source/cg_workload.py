@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 生成cg_cli.py的大规模命令脚本，用于压力测试；同时记录每次saveCanvas时画布像素的校验和，用于检查输出是否正确
+# 用法: python cg_workload.py generate 脚本.txt [--preset lines] [--seed 0] ...
+#       python cg_workload.py check 脚本.txt.checksums.json 输出目录
+import os
+import sys
+import json
+import math
+import random
+import hashlib
+import argparse
+import numpy as np
+from cg_cli import Executor, parse, execute
+
+#各命令默认的相对频率，setColor、saveCanvas由color_every、save_every控制
+MIX = {'drawLine': 4, 'drawPolygon': 2, 'drawEllipse': 1, 'drawCurve': 1, 'translate': 1, 'rotate': 1, 'scale': 1, 'clip': 1}
+
+#预设的负载：generate的参数
+PRESETS = {
+    'mixed': {},
+    'lines': {'commands': 1000000, 'mix': {'drawLine': 1}, 'save_every': 100000},
+    'big-polygon': {'commands': 4, 'mix': {'drawPolygon': 1}, 'polygon_vertices': (100000, 100000), 'save_every': 1},
+    'bezier': {'commands': 100, 'mix': {'drawCurve': 1}, 'curve_points': (500, 500), 'curve_algorithms': ('Bezier',)},
+    'transforms': {'commands': 100000, 'mix': {'drawPolygon': 1, 'translate': 300, 'rotate': 300, 'scale': 300},
+                   'save_every': 10000},
+    'saves': {'commands': 2000, 'save_every': 1},
+}
+
+
+class Shape:
+    """
+    生成器对已有图元的近似记录：不跟踪各点，只跟踪中心与累计缩放，用于让变换链不把图元移出画布或无限放大
+    """
+    __slots__ = ['id', 'kind', 'cx', 'cy', 'log_scale', 'alive']
+
+    def __init__(self, item_id, kind, cx, cy):
+        self.id = item_id
+        self.kind = kind            #'line'、'polygon'、'ellipse'、'curve'
+        self.cx = cx
+        self.cy = cy
+        self.log_scale = 0.0
+        self.alive = True           #被裁剪的线段可能已被删除，不再引用
+
+
+def format_points(p_list):
+    return ' '.join('%d %d' % (x, y) for x, y in p_list)
+
+
+def generate(seed=0, commands=1000, size=1000, mix=None, save_every=100, color_every=10,
+             line_length=(1, 200), polygon_vertices=(3, 12), polygon_radius=(5, 150), curve_points=(4, 12),
+             curve_algorithms=('Bezier', 'B-spline'), fill_ratio=0.3, coords='uniform', clusters=8, colors=0):
+    """按给定的命令频率与参数分布生成命令脚本，同一组参数总是生成相同的脚本
+
+    :param seed: (int) 随机数种子
+    :param commands: (int) 绘制与变换命令的条数(不含resetCanvas、setColor、saveCanvas)
+    :param size: (int) 画布的宽与高
+    :param mix: (dict of string -> float) 各命令的相对频率，默认为MIX
+    :param save_every: (int) 每执行save_every条命令保存一次画布，脚本末尾总会保存一次
+    :param color_every: (int) 平均每color_every条绘制命令切换一次画笔颜色
+    :param line_length: (tuple of int: (最小值, 最大值)) 线段在x、y方向上的长度范围
+    :param polygon_vertices: (tuple of int) 多边形顶点数的范围
+    :param polygon_radius: (tuple of int) 多边形、椭圆半径的范围
+    :param curve_points: (tuple of int) 曲线控制点数的范围，B样条至少4个
+    :param curve_algorithms: (tuple of string) 曲线使用的算法
+    :param fill_ratio: (float) 多边形与椭圆中填充的比例
+    :param coords: (string) 图元位置的分布，'uniform'为整个画布上均匀分布，'cluster'为集中在clusters个中心附近
+    :param clusters: (int) coords为'cluster'时的中心个数
+    :param colors: (int) 大于0时画笔颜色只从这么多种颜色中选取(调色板画布最多256种)
+    :return: (generator of str) 脚本的各行(不含换行符)
+    """
+    rnd = random.Random(seed)
+    mix = MIX if mix is None else mix
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    palette = [(rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255)) for _ in range(colors)]
+    centers = [(rnd.uniform(0.1, 0.9) * size, rnd.uniform(0.1, 0.9) * size) for _ in range(clusters)]
+    shapes = []                 #可被变换的图元，已被裁剪的线段在被抽到时才移除
+    lines = []                  #可被裁剪的线段
+    transforms = any(name in names for name in ('translate', 'rotate', 'scale', 'clip'))
+    counters = {}
+    margin = size // 20
+
+    def clamp(v):
+        return min(max(int(v), 0), size - 1)
+
+    def position():
+        if coords == 'cluster':
+            x, y = rnd.choice(centers)
+            return clamp(rnd.gauss(x, size / 20)), clamp(rnd.gauss(y, size / 20))
+        return rnd.randint(0, size - 1), rnd.randint(0, size - 1)
+
+    def new_id(kind):
+        counters[kind] = counters.get(kind, 0) + 1
+        return '%s%d' % (kind, counters[kind])
+
+    def pick(items):
+        #随机取一个仍然存在的图元，顺带移除已失效的；取出的下标用于O(1)删除
+        while items:
+            i = rnd.randrange(len(items))
+            if items[i].alive:
+                return i
+            items[i] = items[-1]
+            items.pop()
+        return None
+
+    def polygon_points(n, radius):
+        #按角度排列的星形多边形，顶点过多时周长仍与半径成正比
+        x, y = position()
+        p_list = []
+        for i in range(n):
+            a = 2 * math.pi * i / n
+            r = rnd.uniform(radius / 2, radius)
+            p_list.append([clamp(x + r * math.cos(a)), clamp(y + r * math.sin(a))])
+        return p_list
+
+    yield 'resetCanvas %d %d' % (size, size)
+    saves = 0
+    for count in range(1, commands + 1):
+        name = rnd.choices(names, weights)[0]
+        index = None
+        if name in ('translate', 'rotate', 'scale'):
+            index = pick(shapes)
+        elif name == 'clip':
+            index = pick(lines)
+        if name in ('translate', 'rotate', 'scale', 'clip') and index is None:
+            name = 'drawLine'
+        if name.startswith('draw') and rnd.randrange(color_every) == 0:
+            color = rnd.choice(palette) if palette else (rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255))
+            yield 'setColor %d %d %d' % color
+        if name == 'drawLine':
+            x0, y0 = position()
+            x1 = clamp(x0 + rnd.choice([-1, 1]) * rnd.randint(*line_length))
+            y1 = clamp(y0 + rnd.choice([-1, 1]) * rnd.randint(*line_length))
+            shape = Shape(new_id('line'), 'line', (x0 + x1) / 2, (y0 + y1) / 2)
+            yield 'drawLine %s %d %d %d %d %s' % (shape.id, x0, y0, x1, y1, rnd.choice(['DDA', 'Bresenham']))
+        elif name == 'drawPolygon':
+            p_list = polygon_points(rnd.randint(*polygon_vertices), rnd.randint(*polygon_radius))
+            shape = Shape(new_id('polygon'), 'polygon', *np.mean(p_list, axis=0).tolist())
+            yield 'drawPolygon %s %s %s%s' % (shape.id, format_points(p_list), rnd.choice(['DDA', 'Bresenham']),
+                                              ' fill' if rnd.random() < fill_ratio else '')
+        elif name == 'drawEllipse':
+            x, y = position()
+            a, b = rnd.randint(*polygon_radius), rnd.randint(*polygon_radius)
+            x0, y0, x1, y1 = clamp(x - a), clamp(y - b), clamp(x + a), clamp(y + b)
+            shape = Shape(new_id('ellipse'), 'ellipse', (x0 + x1) / 2, (y0 + y1) / 2)
+            yield 'drawEllipse %s %d %d %d %d%s' % (shape.id, x0, y0, x1, y1, ' fill' if rnd.random() < fill_ratio else '')
+        elif name == 'drawCurve':
+            algorithm = rnd.choice(curve_algorithms)
+            low = max(curve_points[0], 4 if algorithm == 'B-spline' else 2)
+            n = rnd.randint(low, max(curve_points[1], low))
+            x, y = position()
+            radius = rnd.randint(*polygon_radius)
+            p_list = [[clamp(x + rnd.uniform(-radius, radius)), clamp(y + rnd.uniform(-radius, radius))] for _ in range(n)]
+            shape = Shape(new_id('curve'), 'curve', *np.mean(p_list, axis=0).tolist())
+            yield 'drawCurve %s %s %s' % (shape.id, format_points(p_list), algorithm)
+        else:
+            shape = lines[index] if name == 'clip' else shapes[index]
+            if name == 'translate':
+                #随机平移，并把偏离画布中心的图元往回拉
+                dx = rnd.randint(-margin, margin) - int((shape.cx - size / 2) / 4)
+                dy = rnd.randint(-margin, margin) - int((shape.cy - size / 2) / 4)
+                shape.cx += dx
+                shape.cy += dy
+                yield 'translate %s %d %d' % (shape.id, dx, dy)
+            elif name == 'rotate':
+                x, y, r = rnd.randint(0, size - 1), rnd.randint(0, size - 1), rnd.randint(-180, 180)
+                a = math.radians(r)
+                dx, dy = shape.cx - x, shape.cy - y
+                shape.cx, shape.cy = x + dx * math.cos(a) - dy * math.sin(a), y + dx * math.sin(a) + dy * math.cos(a)
+                yield 'rotate %s %d %d %d' % (shape.id, x, y, r)
+            elif name == 'scale':
+                #以图元中心附近为中心缩放，累计缩放偏离1越多越倾向于缩回
+                s = round(math.exp(rnd.uniform(-0.2, 0.2) - shape.log_scale / 2), 3)
+                shape.log_scale += math.log(s)
+                yield 'scale %s %d %d %s' % (shape.id, round(shape.cx), round(shape.cy), s)
+            elif name == 'clip':
+                x0, y0 = position()
+                x1, y1 = clamp(x0 + rnd.randint(margin, 4 * margin)), clamp(y0 + rnd.randint(margin, 4 * margin))
+                yield 'clip %s %d %d %d %d %s' % (shape.id, x0, y0, x1, y1, rnd.choice(['Cohen-Sutherland', 'Liang-Barsky']))
+                shape.alive = False
+                lines[index] = lines[-1]
+                lines.pop()
+            shape = None
+        if shape is not None and transforms:
+            shapes.append(shape)
+            if shape.kind == 'line':
+                lines.append(shape)
+        if count % save_every == 0 or count == commands:
+            yield 'saveCanvas canvas%d' % saves
+            saves += 1
+
+
+def checksum(canvas):
+    """(string) 画布像素的sha256，canvas为[height, width, 3]的uint8 RGB数组，第0行为图像顶部"""
+    return hashlib.sha256(np.ascontiguousarray(canvas, np.uint8).tobytes()).hexdigest()
+
+
+class ChecksumExecutor(Executor):
+    """
+    串行执行命令，saveCanvas时只记录画布的校验和，不写文件
+    """
+    def __init__(self):
+        super().__init__('')
+        self.checksums = {}
+
+    def save_canvas(self, save_name):
+        self.checksums[save_name] = checksum(self.canvas.render())
+
+
+def write_workload(path, lines, checksums=True):
+    """将脚本写入文件；checksums为True时同时串行执行脚本，返回各次saveCanvas的校验和
+
+    :param path: (string) 脚本路径
+    :param lines: (iterable of str) 脚本的各行，如generate的返回值
+    :param checksums: (bool) 是否计算校验和
+    :return: (dict of string -> string) 保存名 -> 校验和，不计算时为空
+    """
+    executor = ChecksumExecutor() if checksums else None
+    with open(path, 'w') as fp:
+        for line in lines:
+            fp.write(line + '\n')
+            if executor is not None:
+                execute(parse([line]), executor)
+    return executor.checksums if executor is not None else {}
+
+
+def load_image(path):
+    """读入cg_cli.py输出的图像(24位或调色板bmp、png)，返回RGB数组"""
+    from PIL import Image
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def check(checksums, output_dir):
+    """检查输出目录中的图像与校验和是否一致
+
+    :param checksums: (dict of string -> string) 保存名 -> 校验和
+    :param output_dir: (string) cg_cli.py的输出目录
+    :return: (list of string) 缺失或不一致的保存名
+    """
+    failed = []
+    for name, expected in checksums.items():
+        paths = [os.path.join(output_dir, name + ext) for ext in ('.bmp', '.png')]
+        paths = [p for p in paths if os.path.exists(p)]
+        if not paths or checksum(load_image(paths[0])) != expected:
+            failed.append(name)
+    return failed
+
+
+def parse_range(text):
+    """'a:b'或'a'解析为(a, b)"""
+    low, _, high = text.partition(':')
+    return int(low), int(high or low)
+
+
+def parse_mix(text):
+    """'drawLine=4,clip=1'解析为{'drawLine': 4.0, 'clip': 1.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in MIX:
+            raise argparse.ArgumentTypeError('unknown command in mix: %s' % name)
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+    gen = commands.add_parser('generate', help='生成命令脚本及其校验和')
+    gen.add_argument('script')
+    gen.add_argument('--preset', choices=sorted(PRESETS), default='mixed')
+    gen.add_argument('--seed', type=int, default=0)
+    gen.add_argument('--commands', type=int, help='绘制与变换命令的条数')
+    gen.add_argument('--size', type=int, help='画布的宽与高')
+    gen.add_argument('--mix', type=parse_mix, help='各命令的相对频率，如drawLine=4,clip=1')
+    gen.add_argument('--save-every', type=int, help='每多少条命令保存一次画布')
+    gen.add_argument('--line-length', type=parse_range, help='线段长度范围，如1:200')
+    gen.add_argument('--polygon-vertices', type=parse_range, help='多边形顶点数范围，如3:12')
+    gen.add_argument('--polygon-radius', type=parse_range, help='多边形、椭圆半径范围')
+    gen.add_argument('--curve-points', type=parse_range, help='曲线控制点数范围')
+    gen.add_argument('--colors', type=int, help='画笔颜色的种数，用于测试调色板画布(--palette)时不超过255')
+    gen.add_argument('--coords', choices=['uniform', 'cluster'], help='图元位置的分布')
+    gen.add_argument('--checksums', help='校验和文件，默认为<脚本>.checksums.json')
+    gen.add_argument('--no-checksums', action='store_true', help='不执行脚本，只生成脚本')
+    chk = commands.add_parser('check', help='检查cg_cli.py的输出与校验和是否一致')
+    chk.add_argument('checksums')
+    chk.add_argument('output_dir')
+    args = parser.parse_args(argv)
+
+    if args.command == 'check':
+        with open(args.checksums) as fp:
+            expected = json.load(fp)['checksums']
+        failed = check(expected, args.output_dir)
+        print('%d/%d canvases match' % (len(expected) - len(failed), len(expected)))
+        for name in failed:
+            print('mismatch: %s' % name)
+        return 1 if failed else 0
+
+    options = dict(PRESETS[args.preset])
+    for name in ['commands', 'size', 'mix', 'save_every', 'line_length', 'polygon_vertices', 'polygon_radius',
+                 'curve_points', 'coords', 'colors']:
+        if getattr(args, name) is not None:
+            options[name] = getattr(args, name)
+    checksums = write_workload(args.script, generate(args.seed, **options), not args.no_checksums)
+    if not args.no_checksums:
+        with open(args.checksums or args.script + '.checksums.json', 'w') as fp:
+            json.dump({'preset': args.preset, 'seed': args.seed, 'options': options, 'checksums': checksums}, fp, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())